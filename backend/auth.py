@@ -1,19 +1,155 @@
-from fastapi import Header, HTTPException, Depends
-from firebase_admin import auth
+import hashlib
+import threading
+import time
+import jwt
+import firebase_admin
+from firebase_admin import auth as firebase_auth
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
+from cachetools import TTLCache
+from cryptography.hazmat.backends import default_backend
+import config
 
-async def verify_token(authorization: Optional[str] = Header(None)):
+# Decoded ID tokens keyed by the SHA-256 of the raw JWT, so repeat requests
+# within the cache window skip verification entirely.
+_token_cache = TTLCache(maxsize=config.TOKEN_CACHE_MAX_SIZE, ttl=config.TOKEN_CACHE_TTL_SECONDS)
+
+# Google's signing keys are fetched once and reused for the lifespan of the
+# cache, so verification is a local RS256 check rather than a network call.
+_jwks_client = jwt.PyJWKClient(
+    config.FIREBASE_JWKS_URL,
+    cache_keys=True,
+    lifespan=config.FIREBASE_JWKS_CACHE_SECONDS
+)
+
+
+# Revocation denylist: firebase_uid -> time its sessions were revoked. Tokens
+# are verified locally, so revocation is enforced here instead of asking
+# Firebase on every request. ID tokens live at most an hour, so an entry can
+# be dropped after that, and the hour also bounds exposure on instances that
+# never saw the revocation.
+ID_TOKEN_LIFETIME_SECONDS = 3600
+_revoked_after = TTLCache(maxsize=config.REVOKED_USERS_MAX_SIZE, ttl=ID_TOKEN_LIFETIME_SECONDS)
+_revoked_after_lock = threading.Lock()
+
+
+def revoke_user_tokens(firebase_uid: str):
+    """Revoke a user's Firebase sessions and deny their current ID tokens."""
+    firebase_auth.revoke_refresh_tokens(firebase_uid)
+    with _revoked_after_lock:
+        _revoked_after[firebase_uid] = time.time()
+
+
+def _is_revoked(decoded_token: dict) -> bool:
+    with _revoked_after_lock:
+        revoked_after = _revoked_after.get(decoded_token["uid"])
+    if revoked_after is None:
+        return False
+    return decoded_token.get("auth_time", decoded_token["iat"]) < revoked_after
+
+
+def crypto_backend_info() -> str:
+    """Describe the OpenSSL build that RS256 verification runs on."""
+    return default_backend().openssl_version_text()
+
+
+def prefetch_signing_keys():
+    """Fetch Google's signing keys so the first request verifies locally."""
+    _jwks_client.get_signing_keys()
+
+
+def _get_project_id() -> str:
+    """Firebase project ID, falling back to the initialized Admin app."""
+    return config.FIREBASE_PROJECT_ID or firebase_admin.get_app().project_id
+
+
+def _decode_id_token(token: str) -> dict:
+    """Verify a Firebase ID token offline against the cached JWKS."""
+    project_id = _get_project_id()
+    signing_key = _jwks_client.get_signing_key_from_jwt(token)
+    decoded_token = jwt.decode(
+        token,
+        signing_key.key,
+        algorithms=["RS256"],
+        audience=project_id,
+        issuer=f"https://securetoken.google.com/{project_id}",
+        options={"require": ["exp", "iat", "sub"]}
+    )
+    if not decoded_token["sub"]:
+        raise jwt.InvalidTokenError("Token has an empty subject")
+    # Mirror firebase_admin, which exposes the subject as 'uid'
+    decoded_token["uid"] = decoded_token["sub"]
+    return decoded_token
+
+
+async def verify_token(authorization: Optional[str]) -> dict:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     
     token = authorization.split(" ")[1]
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+
+    cached = _token_cache.get(token_hash)
+    if cached is not None:
+        decoded_token, expires_at = cached
+        if expires_at > time.time():
+            if _is_revoked(decoded_token):
+                raise HTTPException(status_code=401, detail="Token has been revoked")
+            return decoded_token
+        _token_cache.pop(token_hash, None)
     
     try:
-        # Verify the ID token while checking if the token is revoked by passing check_revoked=True.
-        decoded_token = auth.verify_id_token(token, check_revoked=True)
-        return decoded_token
+        # RSA verification (and a JWKS fetch on key rotation) runs off the
+        # event loop so it cannot stall other requests
+        decoded_token = await run_in_threadpool(_decode_id_token, token)
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
 
-def get_current_user(decoded_token: dict = Depends(verify_token)):
+    if _is_revoked(decoded_token):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    # Never serve a cached token past its own expiry
+    expires_at = min(decoded_token["exp"], time.time() + config.TOKEN_CACHE_TTL_SECONDS)
+    _token_cache[token_hash] = (decoded_token, expires_at)
     return decoded_token
+
+# Paths served without a token
+PUBLIC_PATHS = frozenset({"/", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json"})
+
+
+class AuthMiddleware:
+    """
+    Raw ASGI middleware that verifies the bearer token once per request and
+    stores the decoded token in scope["user"], so handlers read it directly
+    instead of going through a dependency chain.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in PUBLIC_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        authorization = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+                break
+
+        try:
+            scope["user"] = await verify_token(authorization)
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code)
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+
+def get_current_user(request: Request) -> dict:
+    """Decoded token stored by AuthMiddleware."""
+    return request.scope["user"]
@@ -9,6 +9,18 @@ FIREBASE_SERVICE_ACCOUNT_PATH = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH", "serv
 # Google Cloud Storage Configuration
 GCS_SERVICE_ACCOUNT_PATH = os.getenv("GCS_SERVICE_ACCOUNT_PATH")  # Optional: dedicated GCS service account
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
+# Patch the bucket's CORS rules when the app boots; otherwise run `python setup.py` once
+SET_CORS_ON_BOOT = os.getenv("SET_CORS_ON_BOOT", "false").lower() == "true"
+
+# Auth Configuration
+FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID")  # Optional: defaults to the Firebase Admin app's project
+FIREBASE_JWKS_URL = "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com"
+FIREBASE_JWKS_CACHE_SECONDS = int(os.getenv("FIREBASE_JWKS_CACHE_SECONDS", "21600"))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+REVOKED_USERS_MAX_SIZE = int(os.getenv("REVOKED_USERS_MAX_SIZE", "10000"))
+USER_ID_CACHE_TTL_SECONDS = int(os.getenv("USER_ID_CACHE_TTL_SECONDS", "3600"))
+USER_ID_CACHE_MAX_SIZE = int(os.getenv("USER_ID_CACHE_MAX_SIZE", "10000"))
 
 # PostgreSQL Configuration
 DB_HOST = os.getenv("DB_HOST")
@@ -16,6 +28,11 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASS = os.getenv("DB_PASS")
 DB_PORT = os.getenv("DB_PORT")
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN", "10"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "50"))
+DB_DSN = os.getenv("DB_DSN")  # Optional: overrides the settings above, e.g. a PgBouncer DSN on port 6432
+# Server-side prepared statements do not survive PgBouncer transaction pooling
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true"
 
 # CORS Configuration
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
@@ -27,13 +44,19 @@ DEFAULT_ORIGINS = [
     "https://ai-educate-gemini-3-hackathon.web.app",
     "https://ai-educate-gemini-3-hackathon.firebaseapp.com"
 ]
-ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", ",".join(DEFAULT_ORIGINS)).split(",")
-ALLOWED_ORIGINS = [url.strip() for url in ALLOWED_ORIGINS if url.strip()]
+ALLOWED_ORIGINS = frozenset(
+    url.strip() for url in os.getenv("ALLOWED_ORIGINS", ",".join(DEFAULT_ORIGINS)).split(",") if url.strip()
+)
 
 # File Upload Configuration
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
-ALLOWED_FILE_EXTENSIONS = set(os.getenv("ALLOWED_FILE_EXTENSIONS", "pdf,jpg,jpeg,png,txt,doc,docx").split(","))
+MAX_BULK_UPLOAD_SIZE_MB = int(os.getenv("MAX_BULK_UPLOAD_SIZE_MB", "100"))
+MAX_BULK_UPLOAD_SIZE_BYTES = MAX_BULK_UPLOAD_SIZE_MB * 1024 * 1024
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # Boundaries and form fields around the file
+ALLOWED_FILE_EXTENSIONS = frozenset(
+    ext.strip().lower() for ext in os.getenv("ALLOWED_FILE_EXTENSIONS", "pdf,jpg,jpeg,png,txt,doc,docx").split(",") if ext.strip()
+)
 
 # Validation Constraints
 MAX_KNOWLEDGE_NAME_LENGTH = 100
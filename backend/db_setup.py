@@ -122,25 +122,34 @@ def setup_database():
         """
 
         # Create indexes
+        # users.firebase_uid is already unique; its constraint index serves uid -> id lookups
+        # One active preference row per (user, category) is the ON CONFLICT target for preference upserts
+        # Active preferences are read per user newest first, or per (user, category) through the unique index
         create_indexes = """
-        CREATE INDEX IF NOT EXISTS idx_firebase_uid ON users(firebase_uid);
-        CREATE INDEX IF NOT EXISTS idx_user_prefs ON user_preferences(user_id, is_active);
+        DROP INDEX IF EXISTS idx_firebase_uid;
+        DROP INDEX IF EXISTS idx_users_firebase_uid_id;
+        DROP INDEX IF EXISTS idx_user_prefs;
+        CREATE INDEX IF NOT EXISTS idx_user_prefs_active_created ON user_preferences(user_id, created_at DESC) WHERE is_active;
         CREATE INDEX IF NOT EXISTS idx_category_lookup ON user_preferences(user_id, category, is_active);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_user_prefs_active_category ON user_preferences(user_id, category) WHERE is_active;
         CREATE INDEX IF NOT EXISTS idx_jsonb_data ON user_preferences USING GIN(preference_data);
         CREATE INDEX IF NOT EXISTS idx_created_at ON user_preferences(created_at DESC);
         """
 
         # Create indexes for knowledge
         create_knowledge_indexes = """
-        CREATE INDEX IF NOT EXISTS idx_knowledge_user ON knowledge(user_id);
+        DROP INDEX IF EXISTS idx_knowledge_user;
+        CREATE INDEX IF NOT EXISTS idx_knowledge_user_created ON knowledge(user_id, created_at DESC);
         CREATE INDEX IF NOT EXISTS idx_knowledge_name ON knowledge(name);
         CREATE INDEX IF NOT EXISTS idx_knowledge_created ON knowledge(created_at DESC);
         """
 
         # Create indexes for materials
         create_materials_indexes = """
-        CREATE INDEX IF NOT EXISTS idx_materials_knowledge ON materials(knowledge_id);
-        CREATE INDEX IF NOT EXISTS idx_materials_user ON materials(user_id);
+        DROP INDEX IF EXISTS idx_materials_knowledge;
+        CREATE INDEX IF NOT EXISTS idx_materials_knowledge_user_created ON materials(knowledge_id, user_id, created_at DESC);
+        DROP INDEX IF EXISTS idx_materials_user;
+        CREATE INDEX IF NOT EXISTS idx_materials_user_storage ON materials(user_id) INCLUDE (storage_path, storage_bucket);
         CREATE INDEX IF NOT EXISTS idx_materials_status ON materials(status);
         CREATE INDEX IF NOT EXISTS idx_materials_storage ON materials(storage_bucket, storage_path);
         CREATE INDEX IF NOT EXISTS idx_materials_metadata ON materials USING GIN(pdf_metadata);
@@ -168,23 +177,99 @@ def setup_database():
         CREATE INDEX IF NOT EXISTS idx_answers_correct ON user_answers(is_correct);
         """
 
-        cur.execute(create_users_table)
-        cur.execute(create_preferences_table)
-        cur.execute(create_knowledge_table)
-        cur.execute(create_materials_table)
-        cur.execute(create_assessments_table)
-        
+        # Indexes for tables owned by the study-session services; created only
+        # once those services have created the tables.
+        # Active context caches are looked up newest first per material
+        create_study_session_indexes = """
+        DO $$
+        BEGIN
+            IF to_regclass('material_context_caches') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS idx_mcc_active ON material_context_caches(material_id, created_at DESC) WHERE status = 'active';
+            END IF;
+        END $$;
+        """
+
+        # Migration: preference details are always a JSON array. Wrap any legacy
+        # scalar (or missing) details once, then enforce the shape
+        migrate_preferences_table = """
+        UPDATE user_preferences
+        SET preference_data = jsonb_set(
+            preference_data,
+            '{details}',
+            CASE
+                WHEN preference_data->'details' IS NULL OR preference_data->'details' = 'null'::jsonb THEN '[]'::jsonb
+                ELSE jsonb_build_array(preference_data->'details')
+            END,
+            true
+        )
+        WHERE jsonb_typeof(preference_data->'details') IS DISTINCT FROM 'array';
+        ALTER TABLE user_preferences DROP CONSTRAINT IF EXISTS details_is_array;
+        ALTER TABLE user_preferences ADD CONSTRAINT details_is_array CHECK ((jsonb_typeof(preference_data->'details') = 'array') IS TRUE);
+        """
+
+        # Migration: the old check-then-insert save_preference could leave two
+        # active rows for one (user, category). Keep the newest, fold the other
+        # rows' details into it, and deactivate them so the unique index builds
+        dedupe_active_preferences = """
+        WITH ranked AS (
+            SELECT id, user_id, category, preference_data->'details' AS details,
+                   row_number() OVER (PARTITION BY user_id, category ORDER BY created_at DESC, id DESC) AS rn,
+                   count(*) OVER (PARTITION BY user_id, category) AS active_rows
+            FROM user_preferences
+            WHERE is_active
+        ),
+        detail_rows AS (
+            SELECT DISTINCT ON (r.user_id, r.category, d.detail)
+                   r.user_id, r.category, d.detail, r.rn, d.position
+            FROM ranked r
+            CROSS JOIN LATERAL jsonb_array_elements(r.details) WITH ORDINALITY AS d(detail, position)
+            WHERE r.active_rows > 1
+            ORDER BY r.user_id, r.category, d.detail, r.rn, d.position
+        ),
+        merged AS (
+            SELECT user_id, category, jsonb_agg(detail ORDER BY rn, position) AS details
+            FROM detail_rows
+            GROUP BY user_id, category
+        ),
+        kept AS (
+            UPDATE user_preferences p
+            SET preference_data = jsonb_set(p.preference_data, '{details}', m.details, true),
+                updated_at = CURRENT_TIMESTAMP
+            FROM ranked r
+            JOIN merged m ON m.user_id = r.user_id AND m.category = r.category
+            WHERE p.id = r.id AND r.rn = 1
+        )
+        UPDATE user_preferences p
+        SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
+        FROM ranked r
+        WHERE p.id = r.id AND r.rn > 1;
+        """
+
         # Migration: Add assessment_type if it doesn't exist
-        cur.execute("ALTER TABLE assessments ADD COLUMN IF NOT EXISTS assessment_type VARCHAR(20) DEFAULT 'pre';")
-
-        cur.execute(create_questions_table)
-        cur.execute(create_user_answers_table)
-        cur.execute(create_indexes)
-        cur.execute(create_knowledge_indexes)
-        cur.execute(create_materials_indexes)
-        cur.execute(create_assessments_indexes)
-        cur.execute(create_questions_indexes)
-        cur.execute(create_answers_indexes)
+        migrate_assessments_table = "ALTER TABLE assessments ADD COLUMN IF NOT EXISTS assessment_type VARCHAR(20) DEFAULT 'pre';"
+
+        # Send all DDL in one round-trip; psycopg2 runs it in a single
+        # transaction that is committed below
+        full_ddl = "\n".join([
+            create_users_table,
+            create_preferences_table,
+            migrate_preferences_table,
+            dedupe_active_preferences,
+            create_knowledge_table,
+            create_materials_table,
+            create_assessments_table,
+            migrate_assessments_table,
+            create_questions_table,
+            create_user_answers_table,
+            create_indexes,
+            create_knowledge_indexes,
+            create_materials_indexes,
+            create_assessments_indexes,
+            create_questions_indexes,
+            create_answers_indexes,
+            create_study_session_indexes,
+        ])
+        cur.execute(full_ddl)
 
         conn.commit()
 
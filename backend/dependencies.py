@@ -1,8 +1,12 @@
 from auth import get_current_user as _get_current_user
 from setup import bucket
 import config
+import functools
+import re
+import threading
 import psycopg2
-from psycopg2 import pool
+from psycopg2 import pool, extensions
+from cachetools import TTLCache
 from contextlib import contextmanager
 
 
@@ -13,23 +17,55 @@ get_current_user = _get_current_user
 # PostgreSQL connection pool
 _db_pool = None
 
+# firebase_uid -> users.id; the mapping never changes while the account exists
+_user_id_cache = TTLCache(maxsize=config.USER_ID_CACHE_MAX_SIZE, ttl=config.USER_ID_CACHE_TTL_SECONDS)
+_user_id_cache_lock = threading.Lock()
+
+
+class PreparingConnection(extensions.connection):
+    """Connection that remembers which named statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
 
 def get_db_pool():
-    """Get or create PostgreSQL connection pool."""
+    """
+    Get or create PostgreSQL connection pool.
+
+    The pool opens minconn connections up front, so calling this at startup
+    keeps the connection handshake off the first requests.
+    """
     global _db_pool
     if _db_pool is None:
-        _db_pool = pool.SimpleConnectionPool(
-            1,  # minconn
-            10,  # maxconn
-            host=config.DB_HOST,
-            database=config.DB_NAME,
-            user=config.DB_USER,
-            password=config.DB_PASS,
-            port=config.DB_PORT
+        if config.DB_DSN:
+            connect_kwargs = {"dsn": config.DB_DSN}
+        else:
+            connect_kwargs = {
+                "host": config.DB_HOST,
+                "database": config.DB_NAME,
+                "user": config.DB_USER,
+                "password": config.DB_PASS,
+                "port": config.DB_PORT
+            }
+        _db_pool = pool.ThreadedConnectionPool(
+            config.DB_POOL_MIN_CONN,
+            config.DB_POOL_MAX_CONN,
+            connection_factory=PreparingConnection,
+            **connect_kwargs
         )
     return _db_pool
 
 
+def close_db_pool():
+    """Close every pooled connection (called on shutdown)."""
+    global _db_pool
+    if _db_pool is not None:
+        _db_pool.closeall()
+        _db_pool = None
+
+
 @contextmanager
 def get_db_connection():
     """
@@ -41,14 +77,89 @@ def get_db_connection():
     """
     pool = get_db_pool()
     conn = pool.getconn()
+    if conn.closed:
+        # Replace connections dropped by the server while idle in the pool
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
     try:
         yield conn
         conn.commit()
     except Exception:
-        conn.rollback()
+        if not conn.closed:
+            conn.rollback()
         raise
     finally:
-        pool.putconn(conn)
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+_PLACEHOLDER_RE = re.compile(r"\$(\d+)")
+
+
+@functools.lru_cache(maxsize=None)
+def _to_pyformat(statement: str) -> tuple:
+    """Rewrite $N placeholders as %(pN)s and return the number of parameters."""
+    numbers = {int(n) for n in _PLACEHOLDER_RE.findall(statement)}
+    return _PLACEHOLDER_RE.sub(r"%(p\1)s", statement), max(numbers, default=0)
+
+
+def execute_prepared(cur, name: str, statement: str, params: tuple):
+    """
+    Execute a statement as a server-side prepared statement.
+
+    The statement (written with $1, $2, ... placeholders) is PREPAREd the
+    first time a pooled connection runs it, so Postgres parses and plans it
+    once per connection instead of on every request.
+    """
+    pyformat_statement, param_count = _to_pyformat(statement)
+    if param_count != len(params):
+        raise ValueError(f"Statement {name} takes {param_count} parameters, got {len(params)}")
+    if not config.DB_PREPARED_STATEMENTS:
+        # Behind a transaction-pooling PgBouncer: send the statement as-is,
+        # binding by name so a repeated $N reuses the same value
+        cur.execute(pyformat_statement, {f"p{i}": value for i, value in enumerate(params, 1)})
+        return
+    conn = cur.connection
+    if name not in conn.prepared_statements:
+        cur.execute(f"PREPARE {name} AS {statement}")
+        conn.prepared_statements.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
+
+
+# Returns the new or existing id in one statement without rewriting the row
+# of an existing user (a no-op DO UPDATE would leave a dead tuple per call)
+USER_UPSERT_SQL = """
+    WITH ins AS (
+        INSERT INTO users (firebase_uid) VALUES ($1)
+        ON CONFLICT (firebase_uid) DO NOTHING
+        RETURNING id
+    )
+    SELECT id, TRUE AS inserted FROM ins
+    UNION ALL
+    SELECT id, FALSE AS inserted FROM users WHERE firebase_uid = $1
+    LIMIT 1
+"""
+
+
+def resolve_user_id(cur, firebase_uid: str) -> int:
+    """Get or create the user's id, skipping the database on cache hits."""
+    with _user_id_cache_lock:
+        user_id = _user_id_cache.get(firebase_uid)
+    if user_id is None:
+        execute_prepared(cur, "user_upsert", USER_UPSERT_SQL, (firebase_uid,))
+        row = cur.fetchone()
+        if row is None:
+            # A concurrent first request committed the same uid after this
+            # statement's snapshot; a fresh statement sees its row
+            execute_prepared(cur, "user_upsert", USER_UPSERT_SQL, (firebase_uid,))
+            row = cur.fetchone()
+        user_id, inserted = row
+        # A freshly inserted row disappears if the caller's transaction rolls
+        # back, so only ids of already committed users are cached
+        if not inserted:
+            with _user_id_cache_lock:
+                _user_id_cache[firebase_uid] = user_id
+    return user_id
 
 
 def get_db_cursor():
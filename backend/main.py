@@ -1,6 +1,12 @@
+import re
+import anyio
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import health, knowledge, documents
+from routers import health, knowledge, documents, sessions
+from dependencies import get_db_pool, close_db_pool, get_storage_bucket
+from auth import AuthMiddleware, prefetch_signing_keys, crypto_backend_info
+from utils.validators import UploadSizeLimitMiddleware
 import config
 import logging
 
@@ -11,12 +17,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Serialize responses with orjson rather than the stdlib json encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 
-# Allow CORS for the frontend
+# Reject oversized uploads from Content-Length before the body is read
+app.add_middleware(UploadSizeLimitMiddleware)
+
+# Authenticate requests before routing; added first so CORS stays outermost
+app.add_middleware(AuthMiddleware)
+
+# Allow CORS for the frontend (one pre-compiled regex instead of a list scan)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=config.ALLOWED_ORIGINS,
+    allow_origin_regex="|".join(re.escape(origin) for origin in sorted(config.ALLOWED_ORIGINS)),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -26,6 +39,37 @@ app.add_middleware(
 app.include_router(health.router)
 app.include_router(knowledge.router)
 app.include_router(documents.router)
+app.include_router(sessions.router)
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Warm up the database pool, storage bucket and auth keys before the first request arrives."""
+    get_db_pool()
+    logger.info("Database connection pool ready")
+
+    # Sync handlers run in anyio's worker threads; match their number to the
+    # pool so every in-flight handler can hold a connection without
+    # ThreadedConnectionPool raising "connection pool exhausted"
+    anyio.to_thread.current_default_thread_limiter().total_tokens = config.DB_POOL_MAX_CONN
+
+    bucket = get_storage_bucket()
+    logger.info(f"Storage bucket ready: {bucket.name}")
+
+    logger.info(f"Token verification backend: {crypto_backend_info()}")
+    try:
+        prefetch_signing_keys()
+        logger.info("Firebase signing keys cached")
+    except Exception as e:
+        # Not fatal: keys are fetched on the first token verification instead
+        logger.warning(f"Could not prefetch Firebase signing keys: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled database connections."""
+    close_db_pool()
+    logger.info("Database connection pool closed")
 
 if __name__ == "__main__":
 
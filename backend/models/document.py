@@ -1,11 +1,22 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
 
 
 class DocumentUploadResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     status: str
     storage_path: str
 
 
+class DocumentBulkUploadResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
+    status: str
+    storage_paths: List[str]
+
+
 class DocumentDeleteResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     status: str
@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class KnowledgeCreateResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     status: str
     knowledge_id: str
@@ -1,65 +1,87 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form
-from typing import Optional
-from dependencies import get_current_user, get_storage_bucket
+from fastapi import APIRouter, Request, UploadFile, File, Form
+from fastapi.responses import ORJSONResponse, Response
+from typing import List, Optional
+from dependencies import get_storage_bucket
 from services import document_service
-from models.document import DocumentUploadResponse, DocumentDeleteResponse
+from models.document import DocumentUploadResponse, DocumentBulkUploadResponse, DocumentDeleteResponse
 
 
 router = APIRouter()
 
 
 @router.post("/upload-document", response_model=DocumentUploadResponse)
-async def upload_document(
+def upload_document(
+    request: Request,
     knowledge_id: str = Form(...),
     topic_id: str = Form(None),
-    file: UploadFile = File(...),
-    user: dict = Depends(get_current_user)
+    file: UploadFile = File(...)
 ):
     """Upload a document to a knowledge entry."""
-    firebase_uid = user['uid']
+    firebase_uid = request.scope["user"]["uid"]
     bucket = get_storage_bucket()
 
     storage_path = document_service.upload_document(
         bucket, firebase_uid, knowledge_id, file, topic_id
     )
 
-    return {"status": "success", "storage_path": storage_path}
+    response = DocumentUploadResponse(status="success", storage_path=storage_path)
+    return Response(response.model_dump_json(), media_type="application/json")
+
+
+@router.post("/upload-documents", response_model=DocumentBulkUploadResponse)
+def upload_documents(
+    request: Request,
+    knowledge_id: str = Form(...),
+    topic_id: str = Form(None),
+    files: List[UploadFile] = File(...)
+):
+    """Upload several documents to a knowledge entry."""
+    firebase_uid = request.scope["user"]["uid"]
+    bucket = get_storage_bucket()
+
+    storage_paths = document_service.bulk_upload_documents(
+        bucket, firebase_uid, knowledge_id, files, topic_id
+    )
+
+    response = DocumentBulkUploadResponse(status="success", storage_paths=storage_paths)
+    return Response(response.model_dump_json(), media_type="application/json")
 
 
 @router.delete("/delete-document/{knowledge_id}/{document_id}", response_model=DocumentDeleteResponse)
-async def delete_document(
+def delete_document(
+    request: Request,
     knowledge_id: str,
-    document_id: str,
-    user: dict = Depends(get_current_user)
+    document_id: str
 ):
     """Delete a document from a knowledge entry."""
-    firebase_uid = user['uid']
+    firebase_uid = request.scope["user"]["uid"]
     bucket = get_storage_bucket()
 
     document_service.delete_document(bucket, firebase_uid, knowledge_id, document_id)
 
-    return {"status": "success"}
+    response = DocumentDeleteResponse(status="success")
+    return Response(response.model_dump_json(), media_type="application/json")
 
 
 @router.get("/documents/{document_id}")
-async def get_document_details(
-    document_id: str,
-    user: dict = Depends(get_current_user)
+def get_document_details(
+    request: Request,
+    document_id: str
 ):
     """Get document metadata."""
-    firebase_uid = user['uid']
+    firebase_uid = request.scope["user"]["uid"]
     document = document_service.get_document_details(firebase_uid, document_id)
-    return {"status": "success", "document": document}
+    return ORJSONResponse({"status": "success", "document": document})
 
 
 @router.get("/documents/{document_id}/download-url")
-async def get_document_download_url(
-    document_id: str,
-    user: dict = Depends(get_current_user)
+def get_document_download_url(
+    request: Request,
+    document_id: str
 ):
     """Get signed URL for downloading document from Cloud Storage."""
-    firebase_uid = user['uid']
+    firebase_uid = request.scope["user"]["uid"]
     bucket = get_storage_bucket()
     url = document_service.get_document_download_url(bucket, firebase_uid, document_id)
-    return {"status": "success", "url": url}
+    return ORJSONResponse({"status": "success", "url": url})
 
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import ORJSONResponse
+from auth import revoke_user_tokens
+
+
+router = APIRouter()
+
+
+@router.post("/revoke-sessions")
+def revoke_sessions(
+    request: Request
+):
+    """Sign the authenticated user out everywhere by revoking their sessions."""
+    firebase_uid = request.scope["user"]["uid"]
+    revoke_user_tokens(firebase_uid)
+    return ORJSONResponse({"status": "success"})
@@ -1,17 +1,123 @@
-import uuid
-import json
+import secrets
+import orjson
 import logging
 from datetime import datetime, timezone
-from typing import Optional
+from typing import List, Optional
 from fastapi import UploadFile, HTTPException
+from psycopg2.extras import execute_values
 from utils.validators import validate_file_size, get_file_extension
 from services import storage_service
-from dependencies import get_db_connection
+from dependencies import get_db_connection, execute_prepared
 
 
 logger = logging.getLogger(__name__)
 
 
+# Hot per-request lookups, run as server-side prepared statements
+KNOWLEDGE_OWNER_SQL = """
+    SELECT u.id
+    FROM knowledge k
+    JOIN users u ON u.id = k.user_id
+    WHERE u.firebase_uid = $1 AND k.id = $2
+"""
+
+# Only the pdf_metadata fields the API exposes are extracted, server-side,
+# so the jsonb blob is neither detoasted in full nor decoded in Python
+DOCUMENT_DETAILS_FIELDS = (
+    "id", "knowledgeId", "filename", "storagePath", "storageBucket", "fileSize",
+    "mimeType", "status", "url", "topicId", "uploadedAt"
+)
+
+DOCUMENT_DETAILS_SQL = """
+    SELECT m.id::text, m.knowledge_id::text, m.original_filename, m.storage_path, m.storage_bucket,
+           m.file_size, m.mime_type, m.status,
+           COALESCE(m.pdf_metadata->>'url', ''), m.pdf_metadata->>'topicId',
+           COALESCE(m.created_at, (m.pdf_metadata->>'uploadedAt')::timestamptz AT TIME ZONE 'UTC')
+    FROM materials m
+    JOIN users u ON u.id = m.user_id
+    WHERE u.firebase_uid = $1 AND m.id = $2
+"""
+
+DOCUMENT_STORAGE_PATH_SQL = """
+    SELECT m.storage_path
+    FROM materials m
+    JOIN users u ON u.id = m.user_id
+    WHERE u.firebase_uid = $1 AND m.id = $2
+"""
+
+
+def _get_knowledge_owner_id(cur, firebase_uid: str, knowledge_id: str) -> int:
+    """Resolve user_id and check knowledge ownership in one query."""
+    execute_prepared(cur, "knowledge_owner", KNOWLEDGE_OWNER_SQL, (firebase_uid, int(knowledge_id)))
+    row = cur.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Knowledge not found")
+    return row[0]
+
+
+def _new_blob_name(firebase_uid: str, knowledge_id: str, file_extension: str) -> str:
+    """Generate a unique storage path for an uploaded material."""
+    return f"users/{firebase_uid}/knowledge/{knowledge_id}/{secrets.token_hex(16)}.{file_extension}"
+
+
+def _material_row(
+    bucket,
+    knowledge_id: str,
+    user_id: int,
+    file: UploadFile,
+    blob_name: str,
+    public_url: str,
+    topic_id: Optional[str]
+) -> tuple:
+    """Build the materials row for an uploaded file."""
+    metadata = {
+        'url': public_url,
+        'topicId': topic_id,
+        'uploadedAt': datetime.now(timezone.utc)
+    }
+
+    return (int(knowledge_id), user_id, file.filename, blob_name, bucket.name, file.size, file.content_type, "uploaded", orjson.dumps(metadata).decode())
+
+
+def bulk_insert_materials(cur, material_rows: List[tuple]) -> List[int]:
+    """
+    Insert materials rows with batched multi-row INSERTs (500 rows per statement).
+
+    Returns:
+        The new material IDs, in row order
+    """
+    inserted = execute_values(
+        cur,
+        """
+        INSERT INTO materials 
+        (knowledge_id, user_id, original_filename, storage_path, storage_bucket, file_size, mime_type, status, pdf_metadata)
+        VALUES %s
+        RETURNING id
+        """,
+        material_rows,
+        template="(%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        page_size=500,
+        fetch=True
+    )
+    return [row[0] for row in inserted]
+
+
+def _insert_uploaded_materials(bucket, material_rows: List[tuple]) -> List[int]:
+    """
+    Insert the rows for already uploaded files on a fresh connection.
+
+    If the insert fails (e.g. the knowledge was deleted during the upload),
+    the uploaded blobs are removed so they are not orphaned.
+    """
+    try:
+        with get_db_connection() as conn:
+            return bulk_insert_materials(conn.cursor(), material_rows)
+    except Exception:
+        for row in material_rows:
+            storage_service.delete_file_from_storage(bucket, row[3])
+        raise
+
+
 def upload_document(
     bucket,
     firebase_uid: str,
@@ -36,49 +142,69 @@ def upload_document(
     validate_file_size(file)
     file_extension = get_file_extension(file.filename)
 
+    # The upload (with its retries) runs between two short transactions, so
+    # no pooled connection is held idle while GCS is slow
     with get_db_connection() as conn:
-        cur = conn.cursor()
-        
-        # Get user_id from firebase_uid
-        cur.execute(
-            "SELECT id FROM users WHERE firebase_uid = %s",
-            (firebase_uid,)
-        )
-        user_row = cur.fetchone()
-        if user_row is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        user_id = user_row[0]
-        
-        # Check if knowledge exists for this user
-        cur.execute(
-            "SELECT id FROM knowledge WHERE id = %s AND user_id = %s",
-            (int(knowledge_id), user_id)
-        )
-        if cur.fetchone() is None:
-            raise HTTPException(status_code=404, detail="Knowledge not found")
-
-        # Generate blob name and upload
-        blob_name = f"users/{firebase_uid}/knowledge/{knowledge_id}/{str(uuid.uuid4())}.{file_extension}"
-        public_url = storage_service.upload_file_to_storage(bucket, blob_name, file)
-
-        # Store document metadata in materials table
-        metadata = {
-            'url': public_url,
-            'topicId': topic_id,
-            'uploadedAt': datetime.now(timezone.utc).isoformat()
-        }
-        
-        cur.execute(
-            """
-            INSERT INTO materials 
-            (knowledge_id, user_id, original_filename, storage_path, storage_bucket, mime_type, status, pdf_metadata)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (int(knowledge_id), user_id, file.filename, blob_name, bucket.name, file.content_type, "uploaded", json.dumps(metadata))
-        )
+        user_id = _get_knowledge_owner_id(conn.cursor(), firebase_uid, knowledge_id)
+
+    blob_name = _new_blob_name(firebase_uid, knowledge_id, file_extension)
+    public_url = storage_service.upload_file_to_storage(bucket, blob_name, file)
+    material_row = _material_row(bucket, knowledge_id, user_id, file, blob_name, public_url, topic_id)
+
+    # Store document metadata in materials table
+    document_id = _insert_uploaded_materials(bucket, [material_row])[0]
+
+    logger.info(f"Document uploaded: {file.filename} (document_id={document_id}) to knowledge {knowledge_id} by firebase_uid {firebase_uid}")
+    return material_row[3]
+
 
-        logger.info(f"Document uploaded: {file.filename} to knowledge {knowledge_id} by firebase_uid {firebase_uid}")
-        return blob_name
+def bulk_upload_documents(
+    bucket,
+    firebase_uid: str,
+    knowledge_id: str,
+    files: List[UploadFile],
+    topic_id: Optional[str] = None
+) -> List[str]:
+    """
+    Upload several documents to a knowledge entry in one request.
+
+    All materials rows are written with a single batched INSERT.
+
+    Args:
+        bucket: Cloud Storage bucket instance
+        firebase_uid: Firebase User ID
+        knowledge_id: Knowledge ID
+        files: The files to upload
+        topic_id: Optional topic ID for categorization
+
+    Returns:
+        storage_paths: The paths where the files are stored, in upload order
+    """
+    # Validate every file before anything is uploaded
+    file_extensions = []
+    for file in files:
+        validate_file_size(file)
+        file_extensions.append(get_file_extension(file.filename))
+
+    with get_db_connection() as conn:
+        user_id = _get_knowledge_owner_id(conn.cursor(), firebase_uid, knowledge_id)
+
+    # Upload all files concurrently, without holding a database connection
+    blob_names = [
+        _new_blob_name(firebase_uid, knowledge_id, file_extension)
+        for file_extension in file_extensions
+    ]
+    public_urls = storage_service.upload_files_to_storage(bucket, list(zip(blob_names, files)))
+    material_rows = [
+        _material_row(bucket, knowledge_id, user_id, file, blob_name, public_url, topic_id)
+        for file, blob_name, public_url in zip(files, blob_names, public_urls)
+    ]
+
+    # Store all document metadata in one statement
+    _insert_uploaded_materials(bucket, material_rows)
+
+    logger.info(f"{len(material_rows)} documents uploaded to knowledge {knowledge_id} by firebase_uid {firebase_uid}")
+    return [row[3] for row in material_rows]
 
 
 def delete_document(bucket, firebase_uid: str, knowledge_id: str, document_id: str):
@@ -94,20 +220,15 @@ def delete_document(bucket, firebase_uid: str, knowledge_id: str, document_id: s
     with get_db_connection() as conn:
         cur = conn.cursor()
         
-        # Get user_id
-        cur.execute(
-            "SELECT id FROM users WHERE firebase_uid = %s",
-            (firebase_uid,)
-        )
-        user_row = cur.fetchone()
-        if user_row is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        user_id = user_row[0]
-        
-        # Get document metadata
+        # Delete the user's document row, returning its storage path
         cur.execute(
-            "SELECT storage_path FROM materials WHERE id = %s AND user_id = %s",
-            (int(document_id), user_id)
+            """
+            DELETE FROM materials m
+            USING users u
+            WHERE m.user_id = u.id AND u.firebase_uid = %s AND m.id = %s
+            RETURNING m.storage_path
+            """,
+            (firebase_uid, int(document_id))
         )
         doc_row = cur.fetchone()
         if doc_row is None:
@@ -118,12 +239,6 @@ def delete_document(bucket, firebase_uid: str, knowledge_id: str, document_id: s
         # Delete from storage
         storage_service.delete_file_from_storage(bucket, storage_path)
         
-        # Delete from database
-        cur.execute(
-            "DELETE FROM materials WHERE id = %s",
-            (int(document_id),)
-        )
-        
         logger.info(f"Document deleted: document_id={document_id} by firebase_uid={firebase_uid}")
 
 
@@ -141,47 +256,14 @@ def get_document_details(firebase_uid: str, document_id: str) -> dict:
     with get_db_connection() as conn:
         cur = conn.cursor()
         
-        # Get user_id
-        cur.execute(
-            "SELECT id FROM users WHERE firebase_uid = %s",
-            (firebase_uid,)
-        )
-        user_row = cur.fetchone()
-        if user_row is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        user_id = user_row[0]
-        
         # Get document details
-        cur.execute(
-            """
-            SELECT id, knowledge_id, original_filename, storage_path, storage_bucket,
-                   file_size, mime_type, status, pdf_metadata, created_at
-            FROM materials
-            WHERE id = %s AND user_id = %s
-            """,
-            (int(document_id), user_id)
-        )
+        execute_prepared(cur, "document_details", DOCUMENT_DETAILS_SQL, (firebase_uid, int(document_id)))
         
         row = cur.fetchone()
         if row is None:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        # Parse metadata (psycopg2 automatically converts jsonb to dict)
-        metadata = row[8] if row[8] else {}
-        
-        return {
-            "id": str(row[0]),
-            "knowledgeId": str(row[1]),
-            "filename": row[2],
-            "storagePath": row[3],
-            "storageBucket": row[4],
-            "fileSize": row[5],
-            "mimeType": row[6],
-            "status": row[7],
-            "url": metadata.get('url', ''),
-            "topicId": metadata.get('topicId'),
-            "uploadedAt": row[9].isoformat() if row[9] else metadata.get('uploadedAt')
-        }
+        return dict(zip(DOCUMENT_DETAILS_FIELDS, row))
 
 
 def get_document_download_url(bucket, firebase_uid: str, document_id: str) -> str:
@@ -199,21 +281,8 @@ def get_document_download_url(bucket, firebase_uid: str, document_id: str) -> st
     with get_db_connection() as conn:
         cur = conn.cursor()
         
-        # Get user_id
-        cur.execute(
-            "SELECT id FROM users WHERE firebase_uid = %s",
-            (firebase_uid,)
-        )
-        user_row = cur.fetchone()
-        if user_row is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        user_id = user_row[0]
-        
         # Get storage path
-        cur.execute(
-            "SELECT storage_path FROM materials WHERE id = %s AND user_id = %s",
-            (int(document_id), user_id)
-        )
+        execute_prepared(cur, "document_storage_path", DOCUMENT_STORAGE_PATH_SQL, (firebase_uid, int(document_id)))
         
         row = cur.fetchone()
         if row is None:
@@ -222,12 +291,7 @@ def get_document_download_url(bucket, firebase_uid: str, document_id: str) -> st
         storage_path = row[0]
         
         # Generate signed URL (valid for 1 hour)
-        blob = bucket.blob(storage_path)
-        url = blob.generate_signed_url(
-            version="v4",
-            expiration=3600,  # 1 hour
-            method="GET"
-        )
+        url = storage_service.generate_download_url(bucket, storage_path)
         
         logger.info(f"Generated download URL for document_id={document_id}")
         return url
@@ -1,14 +1,60 @@
-import uuid
 import logging
-from datetime import datetime, timezone
 from fastapi import HTTPException
 from utils.validators import validate_text_length
-from dependencies import get_db_connection
+from dependencies import get_db_connection, execute_prepared, resolve_user_id
 import config
 
 
 logger = logging.getLogger(__name__)
 
+# Rows fetched per round-trip by the streaming list cursors
+LIST_CURSOR_ITERSIZE = 200
+
+# List queries stream through server-side cursors (DECLARE cannot wrap an
+# EXECUTE), the rest run as server-side prepared statements
+# Queries return API-ready columns in the order of the *_FIELDS tuples so
+# rows are zipped straight into response dicts; datetimes are left for
+# orjson to encode
+KNOWLEDGE_FIELDS = ("id", "name", "description", "createdAt", "updatedAt")
+DOCUMENT_FIELDS = (
+    "id", "filename", "storagePath", "storageBucket", "fileSize",
+    "mimeType", "status", "url", "topicId", "uploadedAt"
+)
+
+KNOWLEDGE_LIST_SQL = """
+    SELECT k.id::text, k.name, k.description, k.created_at, k.updated_at
+    FROM knowledge k
+    JOIN users u ON u.id = k.user_id
+    WHERE u.firebase_uid = %s
+    ORDER BY k.created_at DESC
+"""
+
+KNOWLEDGE_DETAILS_SQL = """
+    SELECT k.id::text, k.name, k.description, k.created_at, k.updated_at
+    FROM knowledge k
+    JOIN users u ON u.id = k.user_id
+    WHERE u.firebase_uid = $1 AND k.id = $2
+"""
+
+KNOWLEDGE_DOCUMENTS_SQL = """
+    SELECT m.id::text, m.original_filename, m.storage_path, m.storage_bucket,
+           m.file_size, m.mime_type, m.status,
+           COALESCE(m.pdf_metadata->>'url', ''), m.pdf_metadata->>'topicId',
+           COALESCE(m.created_at, (m.pdf_metadata->>'uploadedAt')::timestamptz AT TIME ZONE 'UTC')
+    FROM knowledge k
+    JOIN users u ON u.id = k.user_id
+    LEFT JOIN materials m ON m.knowledge_id = k.id AND m.user_id = u.id
+    WHERE u.firebase_uid = %s AND k.id = %s
+    ORDER BY m.created_at DESC
+"""
+
+CREATE_KNOWLEDGE_SQL = """
+    INSERT INTO knowledge 
+    (user_id, name, description)
+    VALUES ($1, $2, $3)
+    RETURNING id
+"""
+
 
 def create_knowledge(firebase_uid: str, name: str, description: str) -> str:
     """
@@ -29,33 +75,11 @@ def create_knowledge(firebase_uid: str, name: str, description: str) -> str:
     with get_db_connection() as conn:
         cur = conn.cursor()
         
-        # First, get or create user
-        cur.execute(
-            "SELECT id FROM users WHERE firebase_uid = %s",
-            (firebase_uid,)
-        )
-        user_row = cur.fetchone()
-        
-        if user_row is None:
-            # Create new user
-            cur.execute(
-                "INSERT INTO users (firebase_uid) VALUES (%s) RETURNING id",
-                (firebase_uid,)
-            )
-            user_id = cur.fetchone()[0]
-        else:
-            user_id = user_row[0]
+        # Get or create user (cached after the first request)
+        user_id = resolve_user_id(cur, firebase_uid)
         
         # Create knowledge entry
-        cur.execute(
-            """
-            INSERT INTO knowledge 
-            (user_id, name, description)
-            VALUES (%s, %s, %s)
-            RETURNING id
-            """,
-            (user_id, name, description)
-        )
+        execute_prepared(cur, "create_knowledge", CREATE_KNOWLEDGE_SQL, (user_id, name, description))
         knowledge_id = cur.fetchone()[0]
         
         logger.info(f"Knowledge created: knowledge_id={knowledge_id} by firebase_uid={firebase_uid}")
@@ -73,39 +97,14 @@ def get_knowledge_list(firebase_uid: str) -> list:
         List of knowledge entries
     """
     with get_db_connection() as conn:
-        cur = conn.cursor()
-        
-        # Get user_id
-        cur.execute(
-            "SELECT id FROM users WHERE firebase_uid = %s",
-            (firebase_uid,)
-        )
-        user_row = cur.fetchone()
-        if user_row is None:
-            return []
-        
-        user_id = user_row[0]
+        cur = conn.cursor(name="knowledge_stream")
+        cur.itersize = LIST_CURSOR_ITERSIZE
         
         # Get all knowledge entries for this user
-        cur.execute(
-            """
-            SELECT id, name, description, created_at, updated_at
-            FROM knowledge
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            """,
-            (user_id,)
-        )
+        cur.execute(KNOWLEDGE_LIST_SQL, (firebase_uid,))
         
-        knowledge_list = []
-        for row in cur.fetchall():
-            knowledge_list.append({
-                "id": str(row[0]),
-                "name": row[1],
-                "description": row[2],
-                "createdAt": row[3].isoformat() if row[3] else None,
-                "updatedAt": row[4].isoformat() if row[4] else None
-            })
+        knowledge_list = [dict(zip(KNOWLEDGE_FIELDS, row)) for row in cur]
+        cur.close()
         
         return knowledge_list
 
@@ -124,38 +123,14 @@ def get_knowledge_details(firebase_uid: str, knowledge_id: str) -> dict:
     with get_db_connection() as conn:
         cur = conn.cursor()
         
-        # Get user_id
-        cur.execute(
-            "SELECT id FROM users WHERE firebase_uid = %s",
-            (firebase_uid,)
-        )
-        user_row = cur.fetchone()
-        if user_row is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        user_id = user_row[0]
-        
-        # Get knowledge details
-        cur.execute(
-            """
-            SELECT id, name, description, created_at, updated_at
-            FROM knowledge
-            WHERE id = %s AND user_id = %s
-            """,
-            (int(knowledge_id), user_id)
-        )
+        # Get knowledge details (unknown users and other users' entries are both 404)
+        execute_prepared(cur, "knowledge_details", KNOWLEDGE_DETAILS_SQL, (firebase_uid, int(knowledge_id)))
         
         row = cur.fetchone()
         if row is None:
             raise HTTPException(status_code=404, detail="Knowledge not found")
         
-        return {
-            "id": str(row[0]),
-            "name": row[1],
-            "description": row[2],
-            "createdAt": row[3].isoformat() if row[3] else None,
-           "updatedAt": row[4].isoformat() if row[4] else None
-        }
+        return dict(zip(KNOWLEDGE_FIELDS, row))
 
 
 def get_knowledge_documents(firebase_uid: str, knowledge_id: str) -> list:
@@ -170,55 +145,22 @@ def get_knowledge_documents(firebase_uid: str, knowledge_id: str) -> list:
         List of documents
     """
     with get_db_connection() as conn:
-        cur = conn.cursor()
+        cur = conn.cursor(name="documents_stream")
+        cur.itersize = LIST_CURSOR_ITERSIZE
         
-        # Get user_id
-        cur.execute(
-            "SELECT id FROM users WHERE firebase_uid = %s",
-            (firebase_uid,)
-        )
-        user_row = cur.fetchone()
-        if user_row is None:
-            raise HTTPException(status_code=404, detail="User not found")
+        # Verify ownership and fetch materials in one query; an owned
+        # knowledge entry with no materials yields a single all-NULL material row
+        cur.execute(KNOWLEDGE_DOCUMENTS_SQL, (firebase_uid, int(knowledge_id)))
         
-        user_id = user_row[0]
+        found = False
+        documents = []
+        for row in cur:
+            found = True
+            if row[0] is not None:
+                documents.append(dict(zip(DOCUMENT_FIELDS, row)))
+        cur.close()
         
-        # Verify knowledge exists and belongs to user
-        cur.execute(
-            "SELECT id FROM knowledge WHERE id = %s AND user_id = %s",
-            (int(knowledge_id), user_id)
-        )
-        if cur.fetchone() is None:
+        if not found:
             raise HTTPException(status_code=404, detail="Knowledge not found")
         
-        # Get all materials for this knowledge
-        cur.execute(
-            """
-            SELECT id, original_filename, storage_path, storage_bucket, 
-                   file_size, mime_type, status, pdf_metadata, created_at
-            FROM materials
-            WHERE knowledge_id = %s AND user_id = %s
-            ORDER BY created_at DESC
-            """,
-            (int(knowledge_id), user_id)
-        )
-        
-        documents = []
-        for row in cur.fetchall():
-            # Parse metadata if it exists (psycopg2 automatically converts jsonb to dict)
-            metadata = row[7] if row[7] else {}
-            
-            documents.append({
-                "id": str(row[0]),
-                "filename": row[1],
-                "storagePath": row[2],
-                "storageBucket": row[3],
-                "fileSize": row[4],
-                "mimeType": row[5],
-                "status": row[6],
-                "url": metadata.get('url', ''),
-                "topicId": metadata.get('topicId'),
-                "uploadedAt": row[8].isoformat() if row[8] else metadata.get('uploadedAt')
-            })
-        
         return documents
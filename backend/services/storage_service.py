@@ -1,9 +1,51 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Tuple
+from cachetools import TTLCache
 from fastapi import UploadFile
 
 
 logger = logging.getLogger(__name__)
 
+# With the size known up front, files up to 8 MB go to GCS in a single
+# multipart request; larger ones use a resumable upload sent in 8 MB chunks
+# straight from the spooled file
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Multi-file uploads run concurrently on this pool; failed attempts are
+# retried with exponential backoff (1s, 2s)
+UPLOAD_MAX_ATTEMPTS = 3
+_upload_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gcs-upload")
+
+# Signed download URLs are valid for 1 hour and reused until a minute before
+# they expire, so repeat downloads skip signing (and any IAM signBlob call)
+SIGNED_URL_EXPIRATION_SECONDS = 3600
+_signed_url_cache = TTLCache(maxsize=10000, ttl=SIGNED_URL_EXPIRATION_SECONDS - 60)
+_signed_url_cache_lock = threading.Lock()
+
+
+def _upload_with_retry(bucket, blob_name: str, file: UploadFile) -> str:
+    """Upload one file, retrying transient failures; returns its public URL."""
+    blob = bucket.blob(blob_name, chunk_size=UPLOAD_CHUNK_SIZE)
+    for attempt in range(UPLOAD_MAX_ATTEMPTS):
+        try:
+            # Passing the known size lets the client pick a single-shot upload
+            # and stream the file as-is instead of buffering it to measure it
+            blob.upload_from_file(
+                file.file,
+                content_type=file.content_type,
+                size=file.size,
+                rewind=True
+            )
+            return blob.public_url
+        except Exception as e:
+            if attempt == UPLOAD_MAX_ATTEMPTS - 1:
+                raise
+            logger.warning(f"Upload of {blob_name} failed (attempt {attempt + 1}): {e}. Retrying")
+            time.sleep(2 ** attempt)
+
 
 def upload_file_to_storage(bucket, blob_name: str, file: UploadFile) -> str:
     """
@@ -18,15 +60,44 @@ def upload_file_to_storage(bucket, blob_name: str, file: UploadFile) -> str:
         public_url: The public URL of the uploaded file
     """
     try:
-        blob = bucket.blob(blob_name)
-        blob.upload_from_file(file.file, content_type=file.content_type)
+        public_url = _upload_with_retry(bucket, blob_name, file)
         logger.info(f"File uploaded to storage: {blob_name}")
-        return blob.public_url
+        return public_url
     except Exception as e:
         logger.error(f"Failed to upload to storage: {str(e)}")
         raise e
 
 
+def upload_files_to_storage(bucket, uploads: List[Tuple[str, UploadFile]]) -> List[str]:
+    """
+    Upload several files to Firebase Storage concurrently.
+
+    Args:
+        bucket: Firebase Storage bucket instance
+        uploads: (blob_name, file) pairs
+
+    Returns:
+        public_urls: The public URLs of the uploaded files, in input order
+    """
+    futures = [
+        _upload_executor.submit(_upload_with_retry, bucket, blob_name, file)
+        for blob_name, file in uploads
+    ]
+    # Let every upload finish so a failure never leaves one still running
+    wait(futures)
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        logger.error(f"Failed to upload to storage: {str(errors[0])}")
+        # Remove the files that did upload; they will never get a materials row
+        for (blob_name, _), future in zip(uploads, futures):
+            if future.exception() is None:
+                delete_file_from_storage(bucket, blob_name)
+        raise errors[0]
+    public_urls = [future.result() for future in futures]
+    logger.info(f"{len(public_urls)} files uploaded to storage")
+    return public_urls
+
+
 def delete_file_from_storage(bucket, storage_path: str) -> None:
     """
     Delete a file from Firebase Storage.
@@ -35,6 +106,8 @@ def delete_file_from_storage(bucket, storage_path: str) -> None:
         bucket: Firebase Storage bucket instance
         storage_path: Path to the file in storage
     """
+    with _signed_url_cache_lock:
+        _signed_url_cache.pop((bucket.name, storage_path), None)
     try:
         blob = bucket.blob(storage_path)
         blob.delete()
@@ -42,3 +115,29 @@ def delete_file_from_storage(bucket, storage_path: str) -> None:
     except Exception as e:
         logger.warning(f"Error deleting from storage: {e}. Continuing anyway.")
         # Continue even if storage deletion fails
+
+
+def generate_download_url(bucket, storage_path: str) -> str:
+    """
+    Get a V4 signed GET URL for a file, reusing a recently signed one.
+
+    Args:
+        bucket: Firebase Storage bucket instance
+        storage_path: Path to the file in storage
+
+    Returns:
+        url: Signed download URL
+    """
+    cache_key = (bucket.name, storage_path)
+    with _signed_url_cache_lock:
+        url = _signed_url_cache.get(cache_key)
+    if url is None:
+        blob = bucket.blob(storage_path)
+        url = blob.generate_signed_url(
+            version="v4",
+            expiration=SIGNED_URL_EXPIRATION_SECONDS,
+            method="GET"
+        )
+        with _signed_url_cache_lock:
+            _signed_url_cache[cache_key] = url
+    return url
@@ -5,18 +5,24 @@ from google.oauth2 import service_account
 import os
 import json
 import base64
+from functools import lru_cache
 from dotenv import load_dotenv
 import config
 
 load_dotenv()
 
+@lru_cache(maxsize=2)
+def _decode_service_account(encoded: str) -> dict:
+    """Decode a base64 service-account JSON blob (once per distinct value)."""
+    return json.loads(base64.b64decode(encoded))
+
 def initialize_firebase_auth():
     """Initialize Firebase for Auth only."""
     # 1. Try Base64 Env Var (for Cloud Run without Secret Manager)
     firebase_base64 = os.getenv("FIREBASE_SERVICE_ACCOUNT_BASE64")
     if firebase_base64:
         try:
-            cred_dict = json.loads(base64.b64decode(firebase_base64))
+            cred_dict = _decode_service_account(firebase_base64)
             cred = credentials.Certificate(cred_dict)
             firebase_admin.initialize_app(cred)
             print("✅ Firebase Admin initialized with Base64 credentials")
@@ -43,7 +49,7 @@ def initialize_gcs_bucket():
     gcs_base64 = os.getenv("GCS_SERVICE_ACCOUNT_BASE64")
     if gcs_base64:
         try:
-            info = json.loads(base64.b64decode(gcs_base64))
+            info = _decode_service_account(gcs_base64)
             creds = service_account.Credentials.from_service_account_info(info)
             client = storage.Client(credentials=creds)
             print("✅ GCS Client initialized with Base64 credentials")
@@ -80,14 +86,21 @@ def set_bucket_cors(bucket_obj):
             "maxAgeSeconds": 3600
         }
     ]
+    bucket_obj.reload()
+    if bucket_obj.cors == cors_configuration:
+        print(f"✅ CORS configuration already up to date for bucket {bucket_obj.name}")
+        return
     bucket_obj.cors = cors_configuration
     bucket_obj.patch()
     print(f"✅ CORS configuration set for bucket {bucket_obj.name}")
 
-if bucket:
+if bucket and config.SET_CORS_ON_BOOT:
     try:
         set_bucket_cors(bucket)
     except Exception as e:
         print(f"❌ Failed to set CORS: {e}")
 
+if __name__ == "__main__":
+    set_bucket_cors(bucket)
+
 
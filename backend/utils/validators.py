@@ -1,12 +1,18 @@
+import os
+from typing import Optional
 from fastapi import UploadFile, HTTPException
+from fastapi.responses import JSONResponse
 import config
 
 
 def validate_file_size(file: UploadFile) -> None:
     """Validate file size doesn't exceed maximum allowed."""
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
+    # Starlette records the size while spooling the upload; only fall back
+    # to seeking when it is unknown
+    file_size = file.size
+    if file_size is None:
+        file_size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)  # Reset to beginning
 
     if file_size > config.MAX_FILE_SIZE_BYTES:
         raise HTTPException(
@@ -15,17 +21,59 @@ def validate_file_size(file: UploadFile) -> None:
         )
 
 
+def validate_content_length(content_length: Optional[int], max_bytes: int) -> None:
+    """Reject a request whose declared body size exceeds max_bytes."""
+    if content_length is not None and content_length > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Request size ({content_length / 1024 / 1024:.2f}MB) exceeds maximum allowed size ({max_bytes / 1024 / 1024:.2f}MB)"
+        )
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Raw ASGI middleware that checks Content-Length on upload routes before
+    the multipart body is read, so oversized uploads are rejected without
+    being spooled to disk. validate_file_size still runs per file for
+    requests that do not declare a length.
+    """
+
+    MAX_BYTES_BY_PATH = {
+        "/upload-document": config.MAX_FILE_SIZE_BYTES + config.MULTIPART_OVERHEAD_BYTES,
+        "/upload-documents": config.MAX_BULK_UPLOAD_SIZE_BYTES + config.MULTIPART_OVERHEAD_BYTES,
+    }
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.MAX_BYTES_BY_PATH.get(scope["path"]) if scope["type"] == "http" else None
+        if max_bytes is not None:
+            content_length = None
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    content_length = int(value) if value.isdigit() else None
+                    break
+            try:
+                validate_content_length(content_length, max_bytes)
+            except HTTPException as e:
+                response = JSONResponse({"detail": e.detail}, status_code=e.status_code)
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+
 def get_file_extension(filename: str) -> str:
     """Safely extract file extension."""
-    if not filename or '.' not in filename:
+    extension = os.path.splitext(filename)[1][1:].lower() if filename else ""
+    if not extension:
         raise HTTPException(status_code=400, detail="File must have an extension")
 
-    extension = filename.rsplit('.', 1)[1].lower()
-
     if extension not in config.ALLOWED_FILE_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"File type '{extension}' not allowed. Allowed types: {', '.join(config.ALLOWED_FILE_EXTENSIONS)}"
+            detail=f"File type '{extension}' not allowed. Allowed types: {', '.join(sorted(config.ALLOWED_FILE_EXTENSIONS))}"
         )
 
     return extension
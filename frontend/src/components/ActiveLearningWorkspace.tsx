@@ -232,10 +232,10 @@ export default function ActiveLearningWorkspace({
                              
                              ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
                              
-                             // Get base64 (JPEG quality 0.6)
-                             const dataUrl = canvas.toDataURL('image/jpeg', 0.6);
-                             const base64Data = dataUrl.split(',')[1];
-                             liveConnection.sendImage(base64Data, 'image/jpeg');
+                             // Encode as JPEG (quality 0.6) and send the raw bytes
+                             canvas.toBlob(blob => {
+                                 if (blob) liveConnection.sendImage(blob, 'image/jpeg');
+                             }, 'image/jpeg', 0.6);
                          }
                     }
                 }, 1000); // Send 1 FPS checking screen
@@ -1,3 +1,7 @@
+// First byte of each binary frame sent to the live agent
+const FRAME_AUDIO = 0x00;
+const FRAME_IMAGE = 0x01;
+
 export type ConnectionStatus = 'disconnected' | 'connecting' | 'connected' | 'error';
 
 export interface LiveAgentEvent {
@@ -161,9 +165,9 @@ export class LiveAgentConnection {
 
     sendAudio(audioData: Blob): void {
         if (this.ws?.readyState === WebSocket.OPEN) {
-            // Send audio as binary data
-            audioData.arrayBuffer().then(buffer => {
-                console.log('🎤 Sending audio chunk:', buffer.byteLength, 'bytes');
+            // Send audio as a binary frame: [0x00][PCM bytes]
+            new Blob([new Uint8Array([FRAME_AUDIO]), audioData]).arrayBuffer().then(buffer => {
+                console.log('🎤 Sending audio chunk:', buffer.byteLength - 1, 'bytes');
                 this.ws?.send(buffer);
             });
         } else {
@@ -183,14 +187,13 @@ export class LiveAgentConnection {
         }
     }
 
-    sendImage(base64Data: string, mimeType: string): void {
+    sendImage(imageData: Blob, mimeType: string): void {
         if (this.ws?.readyState === WebSocket.OPEN) {
-            const message = JSON.stringify({
-                type: 'image',
-                mimeType: mimeType,
-                data: base64Data
+            // Send the image as a binary frame: [0x01][mime length][mime][image bytes]
+            const mime = new TextEncoder().encode(mimeType);
+            new Blob([new Uint8Array([FRAME_IMAGE, mime.length]), mime, imageData]).arrayBuffer().then(buffer => {
+                this.ws?.send(buffer);
             });
-            this.ws.send(message);
         } else {
             console.warn('WebSocket not connected, cannot send image');
         }
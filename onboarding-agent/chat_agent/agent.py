@@ -1,17 +1,18 @@
 
 import os
+import asyncio
 import logging
 import time
-from collections import defaultdict
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from google.adk.agents import Agent
 from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
+from google.adk.agents.run_config import RunConfig, ToolThreadPoolConfig
 from google.genai import types
 from google.adk.models.google_llm import Gemini
-from .tools import save_preference, get_preferences, get_or_create_user
+from .tools import save_preference, save_preferences, get_preferences, get_or_create_user
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -73,7 +74,8 @@ root_agent = Agent(
                 "  ✗ 'My favorite color is blue' (personal detail, not relevant)\n\n"
 
                 "- If information doesn't clearly fit one of the 5 categories, respond naturally but DO NOT save\n"
-                "- Save immediately when you identify a clear category match—no confirmation needed\n\n"
+                "- Save immediately when you identify a clear category match—no confirmation needed\n"
+                "- When one message reveals several preferences, save them together with a single save_preferences call\n\n"
 
                 "## Conversation Flow & Wrap-Up\n"
                 "- Track which of the 5 preference categories you've gathered info on\n"
@@ -87,7 +89,7 @@ root_agent = Agent(
                 "Be authentic and encouraging. Think helpful friend, not corporate chatbot. "
                 "Use contractions, show curiosity, and let the conversation flow naturally. "
                 "This is asynchronous, so there's no rush—prioritize depth over speed.",
-    tools=[save_preference, get_preferences]
+    tools=[save_preference, save_preferences, get_preferences]
 )
 
 # --- 2. Setup Session Service ---
@@ -95,6 +97,20 @@ session_service = InMemorySessionService()
 
 APP_NAME = "onboarding_app"
 
+# Runner holds no per-request state, so one instance serves every request
+runner = Runner(
+    agent=root_agent,
+    app_name=APP_NAME,
+    session_service=session_service
+)
+
+# Tools are blocking psycopg2 calls; running them on a thread pool keeps them
+# off the event loop and lets parallel tool calls in one turn overlap
+TOOL_THREAD_POOL_WORKERS = int(os.environ.get("TOOL_THREAD_POOL_WORKERS", "8"))
+run_config = RunConfig(
+    tool_thread_pool_config=ToolThreadPoolConfig(max_workers=TOOL_THREAD_POOL_WORKERS)
+)
+
 # --- Rate Limiting Configuration ---
 RATE_LIMIT_MAX_REQUESTS = int(os.environ.get("RATE_LIMIT_MAX_REQUESTS", "20"))
 RATE_LIMIT_WINDOW_SECONDS = int(os.environ.get("RATE_LIMIT_WINDOW_SECONDS", "60"))
@@ -102,21 +118,24 @@ MAX_MESSAGE_LENGTH = int(os.environ.get("MAX_MESSAGE_LENGTH", "2000"))
 
 
 class RateLimiter:
-    """Simple in-memory per-UID rate limiter using sliding window."""
+    """In-memory per-UID fixed-window rate limiter with O(1) checks."""
 
     def __init__(self, max_requests: int, window_seconds: int):
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self._requests: dict[str, list[float]] = defaultdict(list)
+        self._window = None
+        self._counts: dict[str, int] = {}
 
     def is_allowed(self, uid: str) -> bool:
-        now = time.time()
-        cutoff = now - self.window_seconds
-        # Prune old timestamps
-        self._requests[uid] = [t for t in self._requests[uid] if t > cutoff]
-        if len(self._requests[uid]) >= self.max_requests:
+        window = int(time.time() // self.window_seconds)
+        if window != self._window:
+            # New window: drop every counter, so idle UIDs never accumulate
+            self._window = window
+            self._counts.clear()
+        count = self._counts.get(uid, 0)
+        if count >= self.max_requests:
             return False
-        self._requests[uid].append(now)
+        self._counts[uid] = count + 1
         return True
 
 
@@ -141,8 +160,20 @@ class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, max_length=MAX_MESSAGE_LENGTH)
     uid: str = None  # Allow UID in body
 
-# Keep track of initialized sessions to inject context only once
-initialized_sessions = set()
+async def get_or_create_session(firebase_uid: str, session_id: str):
+    """Fetch the ADK session, creating it on first use."""
+    session = await session_service.get_session(
+        app_name=APP_NAME,
+        user_id=firebase_uid,
+        session_id=session_id
+    )
+    if session is None:
+        session = await session_service.create_session(
+            app_name=APP_NAME,
+            user_id=firebase_uid,
+            session_id=session_id
+        )
+    return session
 
 @app.post("/chat")
 async def chat(
@@ -173,47 +204,41 @@ async def chat(
     logger.info(f"Chat request - UID: {firebase_uid}, Session: {session_id}")
     logger.debug(f"Message: {user_message[:50]}...")
 
-    # 1. Resolve internal DB User ID
+    # 1. Resolve internal DB User ID (blocking psycopg2 call, so off the event loop)
     try:
-        user_db_id = get_or_create_user(firebase_uid)
+        user_db_id = await asyncio.to_thread(get_or_create_user, firebase_uid)
         logger.info(f"Resolved UID '{firebase_uid}' to DB ID: {user_db_id}")
     except Exception as e:
         logger.error(f"Error resolving user '{firebase_uid}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
     # 2. Ensure session exists in ADK
-    try:
-         await session_service.create_session(
-             app_name=APP_NAME,
-             user_id=firebase_uid, 
-             session_id=session_id
-         )
-    except Exception:
-        # Session might already exist
-        pass
-
-    # 3. Context Injection (First message of the instance session)
-    if session_id not in initialized_sessions:
+    session = await get_or_create_session(firebase_uid, session_id)
+
+    # 3. Context Injection (First message of the session; the flag lives in
+    # session state so it is dropped together with the session)
+    state_delta = None
+    if not session.state.get("initialized"):
         context_prompt = (
             f"(System Note: The current user's Database ID is {user_db_id}. "
-            f"You MUST use this integer ID '{user_db_id}' when calling tools like 'save_preference' or 'get_preferences'. "
+            f"You MUST use this integer ID '{user_db_id}' when calling tools like 'save_preference', 'save_preferences' or 'get_preferences'. "
             f"Do not mention this internal ID to the user.)\n\n{user_message}"
         )
         content = types.Content(role='user', parts=[types.Part(text=context_prompt)])
-        initialized_sessions.add(session_id)
+        state_delta = {"initialized": True}
     else:
         content = types.Content(role='user', parts=[types.Part(text=user_message)])
 
     # 4. Run Agent
-    runner = Runner(
-        agent=root_agent,
-        app_name=APP_NAME,
-        session_service=session_service
-    )
-
     agent_response_text = ""
     try:
-        async for event in runner.run_async(user_id=firebase_uid, session_id=session_id, new_message=content):
+        async for event in runner.run_async(
+            user_id=firebase_uid,
+            session_id=session_id,
+            new_message=content,
+            state_delta=state_delta,
+            run_config=run_config
+        ):
             if event.is_final_response():
                 if event.content and event.content.parts:
                     agent_response_text = event.content.parts[0].text
@@ -247,16 +272,13 @@ async def welcome(
 
     # 1. Resolve internal DB User ID
     try:
-        user_db_id = get_or_create_user(firebase_uid)
+        user_db_id = await asyncio.to_thread(get_or_create_user, firebase_uid)
     except Exception as e:
         logger.error(f"Error resolving user: {e}")
         raise HTTPException(status_code=500, detail="Database error")
 
     # 2. Ensure session exists
-    try:
-        await session_service.create_session(app_name=APP_NAME, user_id=firebase_uid, session_id=session_id)
-    except Exception:
-        pass
+    await get_or_create_session(firebase_uid, session_id)
 
     # 3. Trigger Agent with System Instruction
     # We send a hidden prompt to the agent to make it speak first
@@ -271,18 +293,18 @@ async def welcome(
     
     content = types.Content(role='user', parts=[types.Part(text=trigger_prompt)])
     
-    # Mark session as initialized so future messages don't re-inject context if we had that logic
-    initialized_sessions.add(session_id)
-
-    runner = Runner(
-        agent=root_agent,
-        app_name=APP_NAME,
-        session_service=session_service
-    )
+    # Mark session as initialized so future messages don't re-inject context
+    state_delta = {"initialized": True}
 
     agent_response_text = ""
     try:
-        async for event in runner.run_async(user_id=firebase_uid, session_id=session_id, new_message=content):
+        async for event in runner.run_async(
+            user_id=firebase_uid,
+            session_id=session_id,
+            new_message=content,
+            state_delta=state_delta,
+            run_config=run_config
+        ):
             if event.is_final_response():
                 if event.content and event.content.parts:
                     agent_response_text = event.content.parts[0].text
@@ -0,0 +1,32 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class DbSettings:
+    """Database settings, read from the environment once at import."""
+    host: str
+    name: str
+    user: str
+    password: str
+    port: str
+    pool_min_conn: int
+    pool_max_conn: int
+    # Server-side prepared statements do not survive PgBouncer transaction pooling
+    prepared_statements: bool
+
+    @classmethod
+    def from_env(cls) -> "DbSettings":
+        return cls(
+            host=os.environ.get("DB_HOST", "localhost"),
+            name=os.environ.get("DB_NAME", "db"),
+            user=os.environ.get("DB_USER", "user"),
+            password=os.environ.get("DB_PASS", "password"),
+            port=os.environ.get("DB_PORT", "5432"),
+            pool_min_conn=int(os.environ.get("DB_POOL_MIN_CONN", "1")),
+            pool_max_conn=int(os.environ.get("DB_POOL_MAX_CONN", "16")),
+            prepared_statements=os.environ.get("DB_PREPARED_STATEMENTS", "true").lower() == "true",
+        )
+
+
+settings = DbSettings.from_env()
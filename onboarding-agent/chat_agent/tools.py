@@ -1,62 +1,212 @@
 
+import atexit
+import functools
 import logging
-import json
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import re
+import threading
+from psycopg2 import pool, extensions
+from psycopg2.extras import Json, execute_values
+from cachetools import TTLCache
 from contextlib import contextmanager
 
-# Database Configuration
 import os
+from .db_settings import settings as db_settings
 
-# Database Configuration
-DB_HOST = os.environ.get("DB_HOST", "localhost")
-DB_NAME = os.environ.get("DB_NAME", "db")
-DB_USER = os.environ.get("DB_USER", "user")
-DB_PASS = os.environ.get("DB_PASS", "password")
-DB_PORT = os.environ.get("DB_PORT", "5432")
+logger = logging.getLogger(__name__)
+
+# get_preferences results keyed by (user_id, category); writes evict the user's entries
+PREFERENCES_CACHE_TTL_SECONDS = int(os.environ.get("PREFERENCES_CACHE_TTL_SECONDS", "60"))
+_preferences_cache = TTLCache(maxsize=10000, ttl=PREFERENCES_CACHE_TTL_SECONDS)
+_preferences_cache_lock = threading.Lock()
 
 # Allowed Categories
-ALLOWED_CATEGORIES = {
+ALLOWED_CATEGORIES = frozenset({
     "learning_style",
     "interest",
     "goal",
     "skill_level",
     "communication_style"
-}
+})
+_ALLOWED_CATEGORIES_STR = ", ".join(sorted(ALLOWED_CATEGORIES))
+
+# Insert or merge preference rows in one statement: Postgres appends each new
+# detail to the active record's details list unless it is already present, and
+# leaves the row untouched (no new row version) when every detail is known.
+# The details_is_array constraint guarantees details is always a JSON array
+PREFERENCE_UPSERT_SQL = """
+    INSERT INTO user_preferences (user_id, category, preference_data, source)
+    VALUES %s
+    ON CONFLICT (user_id, category) WHERE is_active DO UPDATE
+    SET preference_data = jsonb_set(
+            user_preferences.preference_data,
+            '{details}',
+            user_preferences.preference_data->'details' || COALESCE((
+                SELECT jsonb_agg(new_detail ORDER BY position)
+                FROM jsonb_array_elements(EXCLUDED.preference_data->'details') WITH ORDINALITY AS d(new_detail, position)
+                WHERE NOT user_preferences.preference_data->'details' @> jsonb_build_array(new_detail)
+            ), '[]'::jsonb),
+            true
+        ),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE NOT user_preferences.preference_data->'details' @> EXCLUDED.preference_data->'details'
+    RETURNING (xmax = 0) AS inserted
+"""
+
+# Hot per-turn statements, run as server-side prepared statements
+PREFERENCE_UPSERT_ONE_SQL = PREFERENCE_UPSERT_SQL.replace("VALUES %s", "VALUES ($1, $2, $3, $4)")
+
+# Returns the new or existing id in one statement without rewriting the row
+# of an existing user (a no-op DO UPDATE would leave a dead tuple per call)
+USER_UPSERT_SQL = """
+    WITH ins AS (
+        INSERT INTO users (firebase_uid) VALUES ($1)
+        ON CONFLICT (firebase_uid) DO NOTHING
+        RETURNING id
+    )
+    SELECT id, TRUE AS inserted FROM ins
+    UNION ALL
+    SELECT id, FALSE AS inserted FROM users WHERE firebase_uid = $1
+    LIMIT 1
+"""
+
+# A user has at most one active row per category; the LIMIT only bounds the
+# read if that ever stops holding. created_at comes back as ISO text so rows
+# are JSON-ready as fetched; ORDER BY names the table column, not that text
+PREFERENCE_COLUMNS = ("category", "preference_data", "created_at")
+
+PREFERENCES_SQL = """
+    SELECT category, preference_data, to_char(created_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS created_at
+    FROM user_preferences
+    WHERE user_id = $1 AND is_active = TRUE
+    ORDER BY user_preferences.created_at DESC
+    LIMIT 50
+"""
+
+PREFERENCES_BY_CATEGORY_SQL = """
+    SELECT category, preference_data, to_char(created_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS created_at
+    FROM user_preferences
+    WHERE user_id = $1 AND category = $2 AND is_active = TRUE
+    ORDER BY user_preferences.created_at DESC
+    LIMIT 50
+"""
+
+# Process-wide connection pool, created on first use
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+class PreparingConnection(extensions.connection):
+    """Connection that remembers which named statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+def get_db_pool():
+    """Get or create the PostgreSQL connection pool."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = pool.ThreadedConnectionPool(
+                    db_settings.pool_min_conn,
+                    db_settings.pool_max_conn,
+                    host=db_settings.host,
+                    database=db_settings.name,
+                    user=db_settings.user,
+                    password=db_settings.password,
+                    port=db_settings.port,
+                    connection_factory=PreparingConnection
+                )
+                atexit.register(_db_pool.closeall)
+    return _db_pool
 
 def get_db_connection():
-    """Establish connection to PostgreSQL database."""
+    """Check out a pooled connection to the PostgreSQL database."""
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-            port=DB_PORT
-        )
+        db_pool = get_db_pool()
+        conn = db_pool.getconn()
+        if conn.closed:
+            # Replace connections dropped by the server while idle in the pool
+            db_pool.putconn(conn, close=True)
+            conn = db_pool.getconn()
         return conn
     except Exception as e:
-        logging.error(f"Database connection failed: {e}")
+        logger.error("Database connection failed: %s", e)
         return None
 
 @contextmanager
 def db_cursor(cursor_factory=None):
-    """Context manager that provides a cursor and handles connection lifecycle."""
+    """Context manager that provides a cursor and returns the connection to the pool."""
     conn = get_db_connection()
     if not conn:
         raise Exception("Database connection failed")
+    cur = None
     try:
         cur = conn.cursor(cursor_factory=cursor_factory) if cursor_factory else conn.cursor()
         yield cur, conn
         conn.commit()
     except Exception:
-        conn.rollback()
+        if not conn.closed:
+            conn.rollback()
         raise
     finally:
-        cur.close()
-        conn.close()
+        if cur is not None:
+            cur.close()
+        get_db_pool().putconn(conn, close=bool(conn.closed))
+
+_PLACEHOLDER_RE = re.compile(r"\$(\d+)")
+
+@functools.lru_cache(maxsize=None)
+def _to_pyformat(statement: str) -> tuple:
+    """Rewrite $N placeholders as %(pN)s and return the number of parameters."""
+    numbers = {int(n) for n in _PLACEHOLDER_RE.findall(statement)}
+    return _PLACEHOLDER_RE.sub(r"%(p\1)s", statement), max(numbers, default=0)
 
+def execute_prepared(cur, name: str, statement: str, params: tuple):
+    """
+    Execute a statement as a server-side prepared statement.
+
+    The statement (written with $1, $2, ... placeholders) is PREPAREd the
+    first time a pooled connection runs it, so Postgres parses and plans it
+    once per connection instead of on every tool call.
+    """
+    pyformat_statement, param_count = _to_pyformat(statement)
+    if param_count != len(params):
+        raise ValueError(f"Statement {name} takes {param_count} parameters, got {len(params)}")
+    if not db_settings.prepared_statements:
+        # Behind a transaction-pooling PgBouncer: send the statement as-is,
+        # binding by name so a repeated $N reuses the same value
+        cur.execute(pyformat_statement, {f"p{i}": value for i, value in enumerate(params, 1)})
+        return
+    conn = cur.connection
+    if name not in conn.prepared_statements:
+        cur.execute(f"PREPARE {name} AS {statement}")
+        conn.prepared_statements.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
+
+def _invalidate_preferences(user_id: int, categories) -> None:
+    """Drop cached get_preferences results made stale by a write."""
+    with _preferences_cache_lock:
+        _preferences_cache.pop((user_id, None), None)
+        for category in categories:
+            _preferences_cache.pop((user_id, category), None)
+
+@functools.lru_cache(maxsize=10000)
 def get_or_create_user(firebase_uid: str) -> int:
+    """
+    Get internal user_id by firebase_uid, caching the mapping in-process.
+    A user's id never changes, so cached entries need no invalidation.
+
+    Args:
+        firebase_uid (str): The Firebase UID.
+
+    Returns:
+        int: The internal database user ID.
+    """
+    return _get_or_create_user_uncached(firebase_uid)
+
+def _get_or_create_user_uncached(firebase_uid: str) -> int:
     """
     Get internal user_id by firebase_uid, or create new user if doesn't exist.
 
@@ -68,25 +218,26 @@ def get_or_create_user(firebase_uid: str) -> int:
     """
     try:
         with db_cursor() as (cur, conn):
-            cur.execute("SELECT id FROM users WHERE firebase_uid = %s", (firebase_uid,))
-            result = cur.fetchone()
-
-            if result:
-                return result[0]
-            else:
-                cur.execute("INSERT INTO users (firebase_uid) VALUES (%s) RETURNING id", (firebase_uid,))
-                user_id = cur.fetchone()[0]
-                logging.info(f"Created new user with firebase_uid: {firebase_uid}")
-                return user_id
+            execute_prepared(cur, "user_upsert", USER_UPSERT_SQL, (firebase_uid,))
+            row = cur.fetchone()
+            if row is None:
+                # A concurrent first request committed the same uid after this
+                # statement's snapshot; a fresh statement sees its row
+                execute_prepared(cur, "user_upsert", USER_UPSERT_SQL, (firebase_uid,))
+                row = cur.fetchone()
+            user_id, inserted = row
+            if inserted:
+                logger.info("Created new user with firebase_uid: %s", firebase_uid)
+            return user_id
     except Exception as e:
-        logging.error(f"Error in get_or_create_user: {e}")
+        logger.error("Error in get_or_create_user: %s", e)
         raise
 
 def save_preference(user_id: int, category: str, detail: str) -> str:
     """
     Saves a user's preference using Smart Upsert logic.
     - Validates category against ALLOWED_CATEGORIES.
-    - If record exists, merges new detail into existing JSON details list.
+    - If record exists, merges new detail into existing JSON details list (server-side).
     - If new, inserts new record.
 
     Args:
@@ -98,62 +249,84 @@ def save_preference(user_id: int, category: str, detail: str) -> str:
         Confirmation message.
     """
     if category not in ALLOWED_CATEGORIES:
-        return f"Error: Invalid category '{category}'. Allowed: {', '.join(ALLOWED_CATEGORIES)}"
+        return f"Error: Invalid category '{category}'. Allowed: {_ALLOWED_CATEGORIES_STR}"
 
     try:
         with db_cursor() as (cur, conn):
-            # Check for existing active record for this category
-            cur.execute(
-                """
-                SELECT id, preference_data FROM user_preferences
-                WHERE user_id = %s AND category = %s AND is_active = TRUE
-                """,
-                (user_id, category)
+            execute_prepared(
+                cur,
+                "preference_upsert_one",
+                PREFERENCE_UPSERT_ONE_SQL,
+                (user_id, category, Json({"details": [detail]}), 'onboarding_smart_upsert')
             )
-            row = cur.fetchone()
+            inserted = cur.fetchall()
+            # No row comes back when the detail was already saved
+            action = ("Created" if inserted[0][0] else "Updated") if inserted else "Kept"
 
-            if row:
-                record_id, existing_data = row
+        _invalidate_preferences(user_id, (category,))
 
-                # Merge Logic: ensuring 'details' is a list of strings
-                current_details = existing_data.get("details", [])
-                if not isinstance(current_details, list):
-                    current_details = [str(current_details)] if current_details else []
+        logger.info("%s preference for User ID %s: %s -> %s", action, user_id, category, detail)
+        return f"Saved preference: {category} - {detail}"
 
-                # Add new detail if not present
-                if detail not in current_details:
-                    current_details.append(detail)
+    except Exception as e:
+        logger.error("Failed to save preference: %s", e)
+        return f"Error: Could not save preference. {str(e)}"
 
-                new_data = {"details": current_details}
+def save_preferences(user_id: int, preferences: list[dict]) -> str:
+    """
+    Saves several preferences at once using Smart Upsert logic.
+    Use this instead of repeated save_preference calls when one message reveals multiple preferences.
 
-                cur.execute(
-                    """
-                    UPDATE user_preferences
-                    SET preference_data = %s, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                    """,
-                    (json.dumps(new_data), record_id)
-                )
-                action = "Updated"
-            else:
-                # Insert New
-                new_data = {"details": [detail]}
-                cur.execute(
-                    """
-                    INSERT INTO user_preferences (user_id, category, preference_data, source)
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (user_id, category, json.dumps(new_data), 'onboarding_smart_upsert')
-                )
-                action = "Created"
+    Args:
+        user_id (int): The database integer ID of the user. You must get this ID before calling this tool.
+        preferences (list[dict]): Items of the form {"category": ..., "detail": ...}. category must be one of:
+            learning_style, interest, goal, skill_level, communication_style
 
-        logging.info(f"{action} preference for User ID {user_id}: {category} -> {detail}")
-        return f"Saved preference: {category} - {detail}"
+    Returns:
+        Confirmation message.
+    """
+    # Validate everything first and group details by category, since one
+    # statement cannot upsert the same (user_id, category) row twice
+    details_by_category = {}
+    for item in preferences:
+        category = item.get("category")
+        detail = item.get("detail")
+        if category not in ALLOWED_CATEGORIES:
+            return f"Error: Invalid category '{category}'. Allowed: {_ALLOWED_CATEGORIES_STR}"
+        if not detail:
+            return f"Error: Missing detail for category '{category}'"
+        details = details_by_category.setdefault(category, [])
+        if detail not in details:
+            details.append(detail)
+
+    if not details_by_category:
+        return "Error: No preferences provided"
+
+    try:
+        with db_cursor() as (cur, conn):
+            execute_values(
+                cur,
+                PREFERENCE_UPSERT_SQL,
+                [
+                    (user_id, category, Json({"details": details}), 'onboarding_smart_upsert')
+                    for category, details in details_by_category.items()
+                ],
+                page_size=500
+            )
+
+        _invalidate_preferences(user_id, details_by_category)
+
+        saved = "; ".join(f"{category} - {', '.join(details)}" for category, details in details_by_category.items())
+        logger.info("Saved %d preference categories for User ID %s: %s", len(details_by_category), user_id, saved)
+        return f"Saved preferences: {saved}"
 
     except Exception as e:
-        logging.error(f"Failed to save preference: {e}")
-        return f"Error: Could not save preference. {str(e)}"
+        logger.error("Failed to save preferences: %s", e)
+        return f"Error: Could not save preferences. {str(e)}"
 
+# Both queries are index scans (see backend/db_setup.py): idx_user_prefs_active_created
+# returns a user's active rows already newest first, and the category lookup hits
+# the unique idx_user_prefs_active_category
 def get_preferences(user_id: int, category: str = None) -> list[dict]:
     """
     Retrieves user preferences.
@@ -162,32 +335,24 @@ def get_preferences(user_id: int, category: str = None) -> list[dict]:
         user_id (int): The database integer ID of the user. You must get this ID before calling this tool.
         category (str, optional): The category to filter by. Defaults to None.
     """
-    try:
-        with db_cursor(cursor_factory=RealDictCursor) as (cur, conn):
-            if category:
-                cur.execute(
-                    """
-                    SELECT category, preference_data, created_at
-                    FROM user_preferences
-                    WHERE user_id = %s AND category = %s AND is_active = TRUE
-                    ORDER BY created_at DESC
-                    """,
-                    (user_id, category)
-                )
-            else:
-                cur.execute(
-                    """
-                    SELECT category, preference_data, created_at
-                    FROM user_preferences
-                    WHERE user_id = %s AND is_active = TRUE
-                    ORDER BY created_at DESC
-                    """,
-                    (user_id,)
-                )
+    cache_key = (user_id, category or None)
+    with _preferences_cache_lock:
+        rows = _preferences_cache.get(cache_key)
 
-            rows = cur.fetchall()
-            return [dict(row) for row in rows]
+    if rows is None:
+        try:
+            with db_cursor() as (cur, conn):
+                if category:
+                    execute_prepared(cur, "preferences_by_category", PREFERENCES_BY_CATEGORY_SQL, (user_id, category))
+                else:
+                    execute_prepared(cur, "preferences", PREFERENCES_SQL, (user_id,))
+                rows = tuple(cur.fetchall())
+        except Exception as e:
+            logger.error("Failed to retrieve preferences: %s", e)
+            return []
 
-    except Exception as e:
-        logging.error(f"Failed to retrieve preferences: {e}")
-        return []
+        # Cached as a tuple; each call builds its own list of row dicts
+        with _preferences_cache_lock:
+            _preferences_cache[cache_key] = rows
+
+    return [dict(zip(PREFERENCE_COLUMNS, row)) for row in rows]
@@ -1,18 +1,60 @@
+import base64
+import functools
+import json
 import os
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
+# Load environment variables from .env file (once per process; main.py and
+# the tools both import this module)
 load_dotenv()
 
+
+@dataclass(frozen=True, slots=True)
+class DbSettings:
+    """Database settings, read from the environment once at import."""
+    host: str
+    name: str
+    user: str
+    password: str
+    port: str
+    pool_min_conn: int
+    pool_max_conn: int
+    # Server-side prepared statements do not survive PgBouncer transaction pooling
+    prepared_statements: bool
+
+    @classmethod
+    def from_env(cls) -> "DbSettings":
+        return cls(
+            host=os.getenv("DB_HOST", "localhost"),
+            name=os.getenv("DB_NAME", "db"),
+            user=os.getenv("DB_USER", "user"),
+            password=os.getenv("DB_PASS", "password"),
+            port=os.getenv("DB_PORT", "5432"),
+            pool_min_conn=int(os.getenv("DB_POOL_MIN_CONN", "2")),
+            pool_max_conn=int(os.getenv("DB_POOL_MAX_CONN", "25")),
+            prepared_statements=os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true",
+        )
+
+
 # Database Configuration
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_NAME = os.getenv("DB_NAME", "db")
-DB_USER = os.getenv("DB_USER", "user")
-DB_PASS = os.getenv("DB_PASS", "password")
-DB_PORT = os.getenv("DB_PORT", "5432")
+db_settings = DbSettings.from_env()
 
 # Google Cloud Storage Configuration
 # Google Cloud Storage Configuration
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 GCS_SERVICE_ACCOUNT_PATH = os.getenv("GCS_SERVICE_ACCOUNT_PATH", "")
+# Set when generated images are publicly readable; their URLs are then returned unsigned
+GCS_PUBLIC_IMAGES = os.getenv("GCS_PUBLIC_IMAGES", "false").lower() == "true"
 GCS_SERVICE_ACCOUNT_BASE64 = os.getenv("GCS_SERVICE_ACCOUNT_BASE64", "")
+# Service account JSON decoded once at import (None when not configured)
+GCS_SERVICE_ACCOUNT_INFO = json.loads(base64.b64decode(GCS_SERVICE_ACCOUNT_BASE64)) if GCS_SERVICE_ACCOUNT_BASE64 else None
+
+
+@functools.cache
+def get_gcs_credentials():
+    """Service account credentials built from GCS_SERVICE_ACCOUNT_INFO, or None."""
+    if GCS_SERVICE_ACCOUNT_INFO is None:
+        return None
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_info(GCS_SERVICE_ACCOUNT_INFO)
@@ -1,18 +1,19 @@
 import os
 from google.adk.agents import Agent
 from google.adk.tools import google_search
-from live_agent.tools import get_user_preferences, get_study_session, get_material_concepts, get_material_context_cache, update_user_understanding, get_user_firebase_uid, generate_image
+from live_agent.tools import bootstrap_session, get_user_preferences, get_study_session, get_material_concepts, get_material_context_cache, update_user_understanding, generate_image
 
 
 
 TUTOR_INSTRUCTION = """You are a friendly, patient, and adaptive AI tutor. Your mission is to deliver a personalised learning experience tailored to each student's interests, preferences, strengths, and weak areas.
 
 ## Session Setup
-At the start of every session, gather context using your tools:
-1. Call `get_study_session` with the session ID to retrieve the study session details — note the user_id, material_id, and weak_concepts.
-2. Call `get_material_context_cache` with the material_id to load the material content into context. This is your primary knowledge source — always have it loaded and reference it throughout the session.
-3. Call `get_material_concepts` with the material_id to get the full concept list, including each concept's user_understanding level and prerequisites.
-4. Call `get_user_preferences` with the user_id to learn the student's learning style, interests, and preferences.
+At the start of every session, call `bootstrap_session` once with the session ID. It returns everything you need in one response:
+1. `session` — the study session details: note the user_id, material_id, and weak_concepts.
+2. `material_context_cache` — the material content cache. This is your primary knowledge source — always have it loaded and reference it throughout the session.
+3. `material_concepts` — the full concept list, including each concept's user_understanding level and prerequisites.
+4. `user_preferences` — the student's learning style, interests, and preferences.
+Do not call `get_study_session`, `get_material_context_cache`, `get_material_concepts` or `get_user_preferences` one by one at startup; use them only if you need to refresh that information later.
 
 ## Material as Foundation
 - The study material is your primary teaching foundation. All explanations, questions, and guidance should be grounded in the material content.
@@ -50,7 +51,7 @@ At the start of every session, gather context using your tools:
 
 ## Visual Aids
 - Use `generate_image` when a visual would help the student understand a concept — diagrams, illustrations, charts, or visual examples.
-- Before calling `generate_image`, call `get_user_firebase_uid` with the user_id to get the user's firebase_uid. Pass both the prompt and firebase_uid to `generate_image`.
+- Pass the prompt and the student's user_id (from the study session) to `generate_image`.
 - Write detailed, descriptive prompts that specify what the image should show, including labels, layout, and educational purpose.
 - **IMPORTANT:** When `generate_image` returns an `image_url`, you MUST embed it in your response using Markdown: `![Image Description](image_url)`.
 - **VOICE OUTPUT:** Do NOT read the Markdown URL aloud. Instead, naturally describe the image or say "I've created an image for you..." and then continue with your explanation.
@@ -63,19 +64,29 @@ At the start of every session, gather context using your tools:
 - You can see the student's screen if they share it. Help them with whatever they are showing, answer questions about the content on screen, and provide guidance based on what you see.
 """
 
+
+def tutor_instruction(_context) -> str:
+    """
+    Serve the tutor prompt verbatim. ADK skips {placeholder} state injection
+    for instruction providers, so every live session opens with byte-identical
+    system text; per-session facts arrive through tools and the opening note.
+    """
+    return TUTOR_INSTRUCTION
+
+
 tutor_agent = Agent(
     model=os.getenv("LIVE_AGENT_MODEL", "gemini-2.5-flash-native-audio-preview-12-2025"),
     name='tutor_agent',
     description='An AI tutor that helps students learn through guided conversation, explanations, and the Socratic method.',
-    instruction=TUTOR_INSTRUCTION,
+    instruction=tutor_instruction,
     tools=[
         google_search,
+        bootstrap_session,
         get_user_preferences,
         get_study_session,
         get_material_concepts,
         get_material_context_cache,
         update_user_understanding,
-        get_user_firebase_uid,
         generate_image,
     ],
 )
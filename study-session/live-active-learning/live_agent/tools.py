@@ -7,27 +7,35 @@ Implements tools for the live active learning agent to interact with the databas
 3. get_material_concepts - Retrieve concepts for a material
 4. get_material_context_cache - Retrieve active cache for a material
 5. update_user_understanding - Update a student's understanding summary for a concept
-6. get_user_firebase_uid - Get a user's Firebase UID from the users table
+6. get_user_firebase_uid - Get a user's Firebase UID from the users table (deprecated)
 7. generate_image - Generate an image using Gemini and upload to GCS
+8. bootstrap_session - Load everything needed at session start in one call
 """
 import logging
-import psycopg2
+import asyncio
+import functools
+import io
+import re
+import threading
+from contextlib import contextmanager
+from psycopg2 import pool, extensions
 from psycopg2.extras import RealDictCursor
-import json
+from cachetools import TTLCache
+import orjson
 import sys
 import os
 import uuid
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
 from google import genai
 from google.cloud import storage
-from google.oauth2 import service_account
-import base64
+from google.cloud.storage.retry import DEFAULT_RETRY
 
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
-from config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT, GCS_BUCKET_NAME, GCS_SERVICE_ACCOUNT_BASE64
+from config import db_settings, GCS_BUCKET_NAME
 
 # Setup logger
 logger = logging.getLogger(__name__)
@@ -42,16 +50,13 @@ if not logger.handlers:
 def initialize_gcs_bucket():
     """Initialize Google Cloud Storage bucket."""
     gcs_cred_path = config.GCS_SERVICE_ACCOUNT_PATH
-    gcs_base64 = config.GCS_SERVICE_ACCOUNT_BASE64
 
     client = None
 
-    # 1. Try Base64 Env Var
-    if gcs_base64:
+    # 1. Try Base64 Env Var (decoded once in config)
+    if config.GCS_SERVICE_ACCOUNT_INFO:
         try:
-            info = json.loads(base64.b64decode(gcs_base64))
-            creds = service_account.Credentials.from_service_account_info(info)
-            client = storage.Client(credentials=creds)
+            client = storage.Client(credentials=config.get_gcs_credentials())
             print("[GCS] Using Base64 credentials")
         except Exception as e:
             print(f"[GCS] Error loading Base64 credentials: {e}")
@@ -77,20 +82,217 @@ def initialize_gcs_bucket():
     return client.bucket(config.GCS_BUCKET_NAME)
 
 
-# Initialize GCS bucket
-gcs_bucket = initialize_gcs_bucket()
+# GCS bucket for generated images, created on first use so the DB tools
+# import without GCS credentials
+_gcs_bucket = None
+_gcs_bucket_lock = threading.Lock()
 
 
-def get_db_connection():
-    """Create database connection with RealDictCursor for dict results"""
-    return psycopg2.connect(
-        host=DB_HOST,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASS,
-        port=DB_PORT,
-        cursor_factory=RealDictCursor
-    )
+def get_gcs_bucket():
+    """Get or create the shared GCS bucket handle."""
+    global _gcs_bucket
+    if _gcs_bucket is None:
+        with _gcs_bucket_lock:
+            if _gcs_bucket is None:
+                _gcs_bucket = initialize_gcs_bucket()
+    return _gcs_bucket
+
+
+def _dumps(obj) -> str:
+    """Encode a tool result as a JSON string (orjson, C-accelerated)."""
+    return orjson.dumps(obj).decode()
+
+
+# Per-call statements, run as server-side prepared statements
+
+# Postgres groups the rows into one {category: preference_data} object. A
+# user has one active row per category; should that ever not hold, the most
+# recently updated row is aggregated last and wins
+PREFERENCES_SQL = """
+    SELECT jsonb_object_agg(category, preference_data ORDER BY updated_at) AS preferences
+    FROM user_preferences
+    WHERE user_id = $1 AND is_active = TRUE
+"""
+
+STUDY_SESSION_SQL = """
+    SELECT id, user_id, material_id, pre_assessment_id, post_assessment_id,
+           weak_concepts, status, started_at, completed_at, created_at, updated_at
+    FROM study_sessions
+    WHERE id = $1
+"""
+
+# Postgres serializes the whole tool result, so the JSON text is returned as-is
+MATERIAL_CONCEPTS_SQL = """
+    SELECT json_build_object(
+               'success', TRUE,
+               'concepts', COALESCE(json_agg(c ORDER BY c.page_start), '[]'::json),
+               'count', count(*)
+           )::text AS payload
+    FROM (
+        SELECT id, material_id, concept_id, concept_name, description,
+               user_understanding, page_start, page_end, prerequisite_concepts, created_at
+        FROM material_concepts
+        WHERE material_id = $1
+    ) c
+"""
+
+# Read as a plain tuple; these name the cache columns the tool returns
+MATERIAL_CONTEXT_CACHE_FIELDS = ("id", "material_id", "cache_name", "created_at", "expires_at", "status")
+
+# Served by the partial index idx_mcc_active (material_id, created_at DESC)
+# WHERE status = 'active': a top-1 index scan with no sort
+MATERIAL_CONTEXT_CACHE_SQL = """
+    SELECT id, material_id, cache_name, created_at, expires_at, status,
+           expires_at > NOW() + make_interval(secs => $1) AS outlives_tool_cache
+    FROM material_context_caches
+    WHERE material_id = $2 AND status = 'active' AND expires_at > NOW()
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+
+UPDATE_UNDERSTANDING_SQL = """
+    UPDATE material_concepts
+    SET user_understanding = $1
+    WHERE id = $2
+    RETURNING id, concept_name, material_id
+"""
+
+FIREBASE_UID_SQL = """
+    SELECT firebase_uid
+    FROM users
+    WHERE id = $1
+"""
+
+
+# Encoded results of read-only material tools, keyed by (tool, material_id).
+# Materials do not change during a session; update_user_understanding evicts
+# the concepts entry it makes stale
+TOOL_CACHE_TTL_SECONDS = 300
+_tool_cache = TTLCache(maxsize=1024, ttl=TOOL_CACHE_TTL_SECONDS)
+_tool_cache_lock = threading.Lock()
+
+
+def _cache_get(key):
+    with _tool_cache_lock:
+        return _tool_cache.get(key)
+
+
+def _cache_put(key, result: str) -> None:
+    with _tool_cache_lock:
+        _tool_cache[key] = result
+
+
+def invalidate(material_id: int) -> None:
+    """Evict cached tool results for a material."""
+    with _tool_cache_lock:
+        _tool_cache.pop(("material_concepts", material_id), None)
+        _tool_cache.pop(("material_context_cache", material_id), None)
+
+
+# Connection pool shared by every tool call, created on first use
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+class PreparingConnection(extensions.connection):
+    """Connection that remembers which named statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+def get_db_pool():
+    """Get or create the PostgreSQL connection pool (RealDictCursor rows)."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = pool.ThreadedConnectionPool(
+                    db_settings.pool_min_conn,
+                    db_settings.pool_max_conn,
+                    host=db_settings.host,
+                    database=db_settings.name,
+                    user=db_settings.user,
+                    password=db_settings.password,
+                    port=db_settings.port,
+                    connection_factory=PreparingConnection,
+                    cursor_factory=RealDictCursor
+                )
+    return _db_pool
+
+
+def close_db_pool():
+    """Close every pooled connection (called on shutdown)."""
+    global _db_pool
+    if _db_pool is not None:
+        _db_pool.closeall()
+        _db_pool = None
+
+
+@contextmanager
+def db_cursor(cursor_factory=None, read_only=False):
+    """
+    Yield a cursor on a pooled connection; commit on success, roll back on error.
+
+    Cursors return RealDictCursor rows unless another cursor_factory is
+    given (extensions.cursor for plain tuples). read_only cursors run in
+    autocommit mode: a single SELECT needs no BEGIN/COMMIT round trips.
+    """
+    db_pool = get_db_pool()
+    conn = db_pool.getconn()
+    if conn.closed:
+        # Replace connections dropped by the server while idle in the pool
+        db_pool.putconn(conn, close=True)
+        conn = db_pool.getconn()
+    try:
+        # Connections come back from the pool idle, so this is a local flag
+        conn.autocommit = read_only
+        with conn.cursor(cursor_factory=cursor_factory) as cursor:
+            yield cursor
+        if not read_only:
+            conn.commit()
+    except Exception:
+        if not conn.closed and not read_only:
+            conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn, close=bool(conn.closed))
+
+
+_PLACEHOLDER_RE = re.compile(r"\$(\d+)")
+
+
+@functools.lru_cache(maxsize=None)
+def _to_pyformat(statement: str) -> tuple:
+    """Rewrite $N placeholders as %(pN)s and return the number of parameters."""
+    numbers = {int(n) for n in _PLACEHOLDER_RE.findall(statement)}
+    return _PLACEHOLDER_RE.sub(r"%(p\1)s", statement), max(numbers, default=0)
+
+
+def execute_prepared(cursor, name: str, statement: str, params: tuple):
+    """
+    Execute a statement as a server-side prepared statement.
+
+    The statement (written with $1, $2, ... placeholders) is PREPAREd the
+    first time a pooled connection runs it, so Postgres parses and plans it
+    once per connection instead of on every tool call. The set of prepared
+    names lives on the connection, so a replaced connection prepares afresh.
+    """
+    pyformat_statement, param_count = _to_pyformat(statement)
+    if param_count != len(params):
+        raise ValueError(f"Statement {name} takes {param_count} parameters, got {len(params)}")
+    if not db_settings.prepared_statements:
+        # Behind a transaction-pooling PgBouncer: send the statement as-is,
+        # binding by name so a repeated $N reuses the same value
+        cursor.execute(pyformat_statement, {f"p{i}": value for i, value in enumerate(params, 1)})
+        return
+    conn = cursor.connection
+    if name not in conn.prepared_statements:
+        cursor.execute(f"PREPARE {name} AS {statement}")
+        conn.prepared_statements.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cursor.execute(f"EXECUTE {name} ({placeholders})", params)
 
 
 def get_user_preferences(user_id: int) -> str:
@@ -104,47 +306,23 @@ def get_user_preferences(user_id: int) -> str:
         JSON string with user preferences grouped by category
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_cursor(read_only=True) as cursor:
+            execute_prepared(cursor, "user_preferences", PREFERENCES_SQL, (user_id,))
 
-        cursor.execute("""
-            SELECT category, preference_data
-            FROM user_preferences
-            WHERE user_id = %s AND is_active = TRUE
-            ORDER BY updated_at DESC
-        """, (user_id,))
-
-        preferences = cursor.fetchall()
-        cursor.close()
-        conn.close()
+            preferences = cursor.fetchone()["preferences"]
 
         if preferences:
-            # Group preferences by category
-            prefs_dict = {}
-            for pref in preferences:
-                category = pref['category']
-                data = pref['preference_data']
-                
-                # If category already exists, merge the data
-                if category in prefs_dict:
-                    if isinstance(prefs_dict[category], dict) and isinstance(data, dict):
-                        prefs_dict[category].update(data)
-                    else:
-                        prefs_dict[category] = data
-                else:
-                    prefs_dict[category] = data
-            
-            return json.dumps({"success": True, "preferences": prefs_dict})
+            return _dumps({"success": True, "preferences": preferences})
         else:
             # No preferences found - agent should have no restrictions
-            return json.dumps({
+            return _dumps({
                 "success": True, 
                 "preferences": {}, 
                 "note": "No user preferences found. Generate responses without preference restrictions."
             })
 
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _dumps({"success": False, "error": str(e)})
 
 
 def get_study_session(session_id: int) -> str:
@@ -159,33 +337,19 @@ def get_study_session(session_id: int) -> str:
         weak_concepts, status, and timestamps
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT id, user_id, material_id, pre_assessment_id, post_assessment_id,
-                   weak_concepts, status, started_at, completed_at, created_at, updated_at
-            FROM study_sessions
-            WHERE id = %s
-        """, (session_id,))
+        with db_cursor(read_only=True) as cursor:
+            execute_prepared(cursor, "study_session", STUDY_SESSION_SQL, (session_id,))
 
-        session = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            session = cursor.fetchone()
 
         if session:
-            # Convert datetime objects to strings
-            session_dict = dict(session)
-            for key in ['started_at', 'completed_at', 'created_at', 'updated_at']:
-                if session_dict[key]:
-                    session_dict[key] = session_dict[key].isoformat()
-            
-            return json.dumps({"success": True, "session": session_dict})
+            # orjson encodes the timestamp columns natively
+            return _dumps({"success": True, "session": session})
         else:
-            return json.dumps({"success": False, "error": "Study session not found"})
+            return _dumps({"success": False, "error": "Study session not found"})
 
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _dumps({"success": False, "error": str(e)})
 
 
 def get_material_concepts(material_id: int) -> str:
@@ -199,34 +363,22 @@ def get_material_concepts(material_id: int) -> str:
         JSON string with list of concepts including concept_id, concept_name,
         description, user_understanding, page ranges, and prerequisites
     """
+    cache_key = ("material_concepts", material_id)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT id, material_id, concept_id, concept_name, description,
-                   user_understanding, page_start, page_end, prerequisite_concepts, created_at
-            FROM material_concepts
-            WHERE material_id = %s
-            ORDER BY page_start
-        """, (material_id,))
-
-        concepts = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
-        # Convert datetime objects to strings
-        concepts_list = []
-        for concept in concepts:
-            concept_dict = dict(concept)
-            if concept_dict['created_at']:
-                concept_dict['created_at'] = concept_dict['created_at'].isoformat()
-            concepts_list.append(concept_dict)
-
-        return json.dumps({"success": True, "concepts": concepts_list, "count": len(concepts_list)})
+        with db_cursor(read_only=True) as cursor:
+            execute_prepared(cursor, "material_concepts", MATERIAL_CONCEPTS_SQL, (material_id,))
+
+            result = cursor.fetchone()["payload"]
+
+        _cache_put(cache_key, result)
+        return result
 
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _dumps({"success": False, "error": str(e)})
 
 
 def get_material_context_cache(material_id: int) -> str:
@@ -240,35 +392,33 @@ def get_material_context_cache(material_id: int) -> str:
         JSON string with cache details including cache_name, created_at,
         expires_at, and status. Returns the most recent active cache.
     """
+    cache_key = ("material_context_cache", material_id)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT id, material_id, cache_name, created_at, expires_at, status
-            FROM material_context_caches
-            WHERE material_id = %s AND status = 'active' AND expires_at > NOW()
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (material_id,))
-
-        cache = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        if cache:
-            # Convert datetime objects to strings
-            cache_dict = dict(cache)
-            for key in ['created_at', 'expires_at']:
-                if cache_dict[key]:
-                    cache_dict[key] = cache_dict[key].isoformat()
-            
-            return json.dumps({"success": True, "cache": cache_dict})
+        with db_cursor(extensions.cursor, read_only=True) as cursor:
+            execute_prepared(
+                cursor, "material_context_cache", MATERIAL_CONTEXT_CACHE_SQL,
+                (TOOL_CACHE_TTL_SECONDS, material_id)
+            )
+
+            row = cursor.fetchone()
+
+        if row:
+            # Only reuse the result while the Gemini cache it names stays valid
+            outlives_tool_cache = row[-1]
+            # orjson encodes the timestamp columns natively
+            result = _dumps({"success": True, "cache": dict(zip(MATERIAL_CONTEXT_CACHE_FIELDS, row))})
+            if outlives_tool_cache:
+                _cache_put(cache_key, result)
+            return result
         else:
-            return json.dumps({"success": True, "cache": None, "message": "No active cache found"})
+            return _dumps({"success": True, "cache": None, "message": "No active cache found"})
 
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _dumps({"success": False, "error": str(e)})
 
 
 def update_user_understanding(material_concept_id: int, understanding_summary: str) -> str:
@@ -283,38 +433,53 @@ def update_user_understanding(material_concept_id: int, understanding_summary: s
             misconceptions observed.
 
     Returns:
-        JSON string with the updated concept id, concept_name, and
-        user_understanding, or an error message.
+        JSON string with the updated concept id and concept_name, or an
+        error message.
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            UPDATE material_concepts
-            SET user_understanding = %s
-            WHERE id = %s
-            RETURNING id, concept_name, user_understanding
-        """, (understanding_summary, material_concept_id))
+        with db_cursor(extensions.cursor) as cursor:
+            # The summary is re-written on every assessment, so losing the
+            # last one in a server crash is acceptable; don't wait on the WAL flush
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            execute_prepared(
+                cursor, "update_understanding", UPDATE_UNDERSTANDING_SQL,
+                (understanding_summary, material_concept_id)
+            )
 
-        updated = cursor.fetchone()
-        conn.commit()
-        cursor.close()
-        conn.close()
+            updated = cursor.fetchone()
 
         if updated:
-            return json.dumps({"success": True, "updated_concept": dict(updated)})
+            concept_id, concept_name, material_id = updated
+            invalidate(material_id)
+            return _dumps({"success": True, "id": concept_id, "concept_name": concept_name})
         else:
-            return json.dumps({"success": False, "error": f"No material_concept found with id {material_concept_id}"})
+            return _dumps({"success": False, "error": f"No material_concept found with id {material_concept_id}"})
 
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _dumps({"success": False, "error": str(e)})
+
+
+@functools.lru_cache(maxsize=4096)
+def _lookup_firebase_uid(user_id: int) -> str:
+    """Firebase UID for a user id; the mapping never changes, so it is cached."""
+    with db_cursor(extensions.cursor, read_only=True) as cursor:
+        execute_prepared(cursor, "firebase_uid", FIREBASE_UID_SQL, (user_id,))
+
+        user = cursor.fetchone()
+
+    if user is None:
+        # Raised rather than returned so misses are not cached
+        raise LookupError(f"No user found with id {user_id}")
+    return user[0]
 
 
 def get_user_firebase_uid(user_id: int) -> str:
     """
     Get a user's Firebase UID from the users table.
 
+    Deprecated: generate_image now takes the user_id and resolves the
+    Firebase UID itself. Kept for existing callers.
+
     Args:
         user_id: ID of the user
 
@@ -322,29 +487,66 @@ def get_user_firebase_uid(user_id: int) -> str:
         JSON string with the user's firebase_uid, or an error message.
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        return _dumps({"success": True, "user_id": user_id, "firebase_uid": _lookup_firebase_uid(user_id)})
+    except Exception as e:
+        return _dumps({"success": False, "error": str(e)})
 
-        cursor.execute("""
-            SELECT id, firebase_uid
-            FROM users
-            WHERE id = %s
-        """, (user_id,))
 
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
+# One Gemini client for every image request, created on first use so the
+# module imports without credentials
+_genai_client = None
+_genai_client_lock = threading.Lock()
 
-        if user:
-            return json.dumps({"success": True, "user_id": user['id'], "firebase_uid": user['firebase_uid']})
-        else:
-            return json.dumps({"success": False, "error": f"No user found with id {user_id}"})
 
-    except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+def get_genai_client() -> genai.Client:
+    """Get or create the shared Gemini client."""
+    global _genai_client
+    if _genai_client is None:
+        with _genai_client_lock:
+            if _genai_client is None:
+                _genai_client = genai.Client()
+    return _genai_client
+
+
+# Runs the independent session-setup lookups side by side
+_bootstrap_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="bootstrap")
+
+
+def bootstrap_session(session_id: int) -> str:
+    """
+    Load all session-start context in one call: the study session, then the
+    material context cache, material concepts and user preferences, which
+    are fetched in parallel.
 
+    Args:
+        session_id: ID of the study session
 
-def generate_image(prompt: str, firebase_uid: str) -> str:
+    Returns:
+        JSON string with the results of get_study_session,
+        get_material_context_cache, get_material_concepts and
+        get_user_preferences
+    """
+    session_result = orjson.loads(get_study_session(session_id))
+    if not session_result.get("success"):
+        return _dumps(session_result)
+
+    session = session_result["session"]
+    material_id = session["material_id"]
+    user_id = session["user_id"]
+
+    # Each lookup only needs ids from the session row
+    futures = {
+        "material_context_cache": _bootstrap_executor.submit(get_material_context_cache, material_id),
+        "material_concepts": _bootstrap_executor.submit(get_material_concepts, material_id),
+        "user_preferences": _bootstrap_executor.submit(get_user_preferences, user_id),
+    }
+    results = {"success": True, "session": session}
+    for key, future in futures.items():
+        results[key] = orjson.loads(future.result())
+    return _dumps(results)
+
+
+async def generate_image(prompt: str, user_id: int) -> str:
     """
     Generate an image using Gemini and upload it to Google Cloud Storage.
 
@@ -352,92 +554,99 @@ def generate_image(prompt: str, firebase_uid: str) -> str:
         prompt: Text description of the image to generate. Should be detailed
             and descriptive, specifying what the image should show including
             labels, layout, and educational purpose.
-        firebase_uid: The user's Firebase UID, used to organize uploaded
-            images under the user's GCS path. Obtain this by calling
-            get_user_firebase_uid first.
+        user_id: ID of the user (from the study session). Uploaded images are
+            organized under the user's GCS path.
 
     Returns:
         JSON string with image_url (public GCS URL) and caption (any text
         Gemini produced alongside the image), or an error message.
     """
     try:
-        logger.info(f"[generate_image] Called with prompt='{prompt[:80]}...', firebase_uid='{firebase_uid}'")
+        logger.info("[generate_image] Called with prompt='%s...', user_id=%s", prompt[:80], user_id)
 
         # Validate inputs
         if not GCS_BUCKET_NAME:
             logger.error("[generate_image] ERROR: GCS_BUCKET_NAME is not set")
-            return json.dumps({"success": False, "error": "GCS_BUCKET_NAME environment variable is not set"})
-        if not firebase_uid:
-            logger.error("[generate_image] ERROR: firebase_uid is empty")
-            return json.dumps({"success": False, "error": "firebase_uid is required"})
+            return _dumps({"success": False, "error": "GCS_BUCKET_NAME environment variable is not set"})
+        # Resolved from the cached user_id -> firebase_uid mapping, so the agent
+        # needs no separate lookup turn before generating an image
+        try:
+            firebase_uid = await asyncio.to_thread(_lookup_firebase_uid, user_id)
+        except LookupError as e:
+            logger.error("[generate_image] ERROR: %s", e)
+            return _dumps({"success": False, "error": str(e)})
 
-        # Generate image with Gemini
+        # Generate image with Gemini (async client, so the live audio stream
+        # keeps flowing while the image renders)
         logger.info("[generate_image] Calling Gemini API...")
-        client = genai.Client()
-        response = client.models.generate_content(
+        response = await get_genai_client().aio.models.generate_content(
             model="gemini-2.5-flash-image",
             contents=[prompt],
         )
 
         # Check response validity
         if not response.candidates:
-            logger.error(f"[generate_image] ERROR: No candidates in response. Prompt feedback: {response.prompt_feedback}")
-            return json.dumps({"success": False, "error": "No candidates returned. The prompt may have been blocked."})
+            logger.error("[generate_image] ERROR: No candidates in response. Prompt feedback: %s", response.prompt_feedback)
+            return _dumps({"success": False, "error": "No candidates returned. The prompt may have been blocked."})
 
         if not response.parts:
-            logger.error(f"[generate_image] ERROR: No parts in response. Finish reason: {response.candidates[0].finish_reason}")
-            return json.dumps({"success": False, "error": f"Empty response. Finish reason: {response.candidates[0].finish_reason}"})
-
-        # Extract caption and image bytes from response parts
-        caption = ""
-        image_bytes = None
-        mime_type = "image/png"
-
-        for part in response.parts:
-            if part.text is not None:
-                caption = part.text
-                logger.info(f"[generate_image] Got caption: '{caption[:100]}'")
-            elif part.inline_data is not None:
-                image_bytes = part.inline_data.data
-                mime_type = part.inline_data.mime_type or "image/png"
-                logger.info(f"[generate_image] Got image: {len(image_bytes)} bytes, mime_type={mime_type}")
-
-        if not image_bytes:
+            logger.error("[generate_image] ERROR: No parts in response. Finish reason: %s", response.candidates[0].finish_reason)
+            return _dumps({"success": False, "error": f"Empty response. Finish reason: {response.candidates[0].finish_reason}"})
+
+        # Extract caption and image bytes from response parts (the last of
+        # each wins, as Gemini may send draft text before the final caption)
+        image_part = next((part for part in reversed(response.parts) if part.inline_data is not None and part.inline_data.data), None)
+        if image_part is None:
             logger.error("[generate_image] ERROR: Response had parts but no image data")
-            return json.dumps({"success": False, "error": "No image was generated by the model"})
+            return _dumps({"success": False, "error": "No image was generated by the model"})
+        caption = next((part.text for part in reversed(response.parts) if part.text is not None), "")
+
+        image_bytes = image_part.inline_data.data
+        mime_type = image_part.inline_data.mime_type or "image/png"
+        logger.info("[generate_image] Got image: %s bytes, mime_type=%s, caption='%s'", len(image_bytes), mime_type, caption[:100])
 
         # Upload to GCS
-        logger.info(f"[generate_image] Uploading to GCS bucket '{GCS_BUCKET_NAME}'...")
+        logger.info("[generate_image] Uploading to GCS bucket '%s'...", GCS_BUCKET_NAME)
         extension = mime_type.split("/")[-1] if mime_type else "png"
         blob_name = f"users/{firebase_uid}/images/{uuid.uuid4()}.{extension}"
-        blob = gcs_bucket.blob(blob_name)
-        blob.upload_from_string(image_bytes, content_type=mime_type)
-
-        # Generate signed URL (valid for 7 days)
-        # Note: This requires the service account credential to be loaded in the client
-        
-        # Debugging: Log what we are using to sign
-        try:
-            signing_email = getattr(gcs_bucket.client._credentials, 'service_account_email', None)
-            logger.info(f"[generate_image] Signing URL with email: {signing_email}")
-        except:
-            pass
-
-        signed_url = blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(days=1),
-            method="GET",
-            service_account_email=None, # Let the client determine this from credentials
-            access_token=None,
+        blob = get_gcs_bucket().blob(blob_name)
+        # Image bytes are already in memory, so the client sends them in one
+        # multipart request; if_generation_match=0 makes it create-only, so
+        # no existing object is ever read or replaced. The client-side
+        # checksum pass is skipped, and retries give up after 10 s rather
+        # than holding the tool call open
+        await asyncio.to_thread(
+            blob.upload_from_file,
+            io.BytesIO(image_bytes),
+            size=len(image_bytes),
+            content_type=mime_type,
+            if_generation_match=0,
+            checksum=None,
+            retry=DEFAULT_RETRY.with_timeout(10)
         )
 
-        logger.info(f"[generate_image] Upload complete. Signed URL generated: {signed_url}")
-        return json.dumps({
+        if config.GCS_PUBLIC_IMAGES:
+            # Publicly readable bucket: no signing (and no IAM signBlob call) needed
+            image_url = blob.public_url
+        else:
+            # Generate signed URL (valid for 1 day), signed with the client's
+            # credentials (their email was logged when the bucket was created)
+            image_url = await asyncio.to_thread(
+                blob.generate_signed_url,
+                version="v4",
+                expiration=timedelta(days=1),
+                method="GET",
+                service_account_email=None, # Let the client determine this from credentials
+                access_token=None,
+            )
+
+        logger.info("[generate_image] Upload complete. Image URL: %s", image_url)
+        return _dumps({
             "success": True,
-            "image_url": signed_url,
+            "image_url": image_url,
             "caption": caption,
         })
 
     except Exception as e:
-        logger.error(f"[generate_image] EXCEPTION: {type(e).__name__}: {e}", exc_info=True)
-        return json.dumps({"success": False, "error": f"{type(e).__name__}: {e}"})
+        logger.error("[generate_image] EXCEPTION: %s: %s", type(e).__name__, e, exc_info=True)
+        return _dumps({"success": False, "error": f"{type(e).__name__}: {e}"})
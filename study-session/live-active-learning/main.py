@@ -1,23 +1,27 @@
 import asyncio
-import json
+import orjson
 import logging
-from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
-from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.agents.run_config import RunConfig, StreamingMode, ToolThreadPoolConfig
 from google.genai import types
 from google.adk.agents.live_request_queue import LiveRequestQueue
 from live_agent.agent import tutor_agent
-
-# Load environment variables
-load_dotenv()
+from live_agent.tools import close_db_pool
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 APP_NAME = "ai-educate"
+
+# 40 ms of 24 kHz 16-bit mono PCM: the smallest audio frame sent to the client
+AUDIO_FLUSH_BYTES = 1920
+
+# First byte of each binary frame from the client
+FRAME_AUDIO = 0x00
+FRAME_IMAGE = 0x01
 # USER_ID = "test_user"
 # SESSION_ID = "audio_session"
 
@@ -33,6 +37,26 @@ runner = Runner(
     session_service=session_service,
 )
 
+
+def _handle_text(json_message: dict, live_request_queue: LiveRequestQueue):
+    """Forward a typed text message to the agent."""
+    content = types.Content(parts=[types.Part(text=json_message["text"])])
+    live_request_queue.send_content(content)
+    logger.info("📨 Sent text message: %s", json_message['text'])
+
+
+# JSON text messages from the client, dispatched on their "type" field
+# (images and audio arrive as binary frames)
+TEXT_MESSAGE_HANDLERS = {
+    "text": _handle_text,
+}
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled database connections."""
+    close_db_pool()
+
 @app.websocket("/ws/{user_id}/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str, session_id: str):
     await websocket.accept()
@@ -44,7 +68,10 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str, session_id: str
         streaming_mode=StreamingMode.BIDI,
         input_audio_transcription=types.AudioTranscriptionConfig(),
         output_audio_transcription=types.AudioTranscriptionConfig(),
-        session_resumption=types.SessionResumptionConfig()
+        session_resumption=types.SessionResumptionConfig(),
+        # Tools make blocking database/GCS calls; run them on a thread pool so
+        # they neither stall the audio stream nor wait on each other
+        tool_thread_pool_config=ToolThreadPoolConfig(max_workers=8)
         # proactivity=types.ProactivityConfig(proactive_audio=True),
         # enable_proactive_audio=True
         # speech_config=types.SpeechConfig(
@@ -58,14 +85,14 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str, session_id: str
     )
 
     # Get Session or create session - use dynamic user_id and session_id
-    logger.info(f"Getting/creating session for user_id={user_id}, session_id={session_id}")
+    logger.info("Getting/creating session for user_id=%s, session_id=%s", user_id, session_id)
     session = await session_service.get_session(
         app_name=APP_NAME,
         user_id=user_id,
         session_id=session_id,
     )
     if not session:
-        logger.info(f"Creating new session for user_id={user_id}, session_id={session_id}")
+        logger.info("Creating new session for user_id=%s, session_id=%s", user_id, session_id)
         await session_service.create_session(
             app_name=APP_NAME,
             user_id=user_id,
@@ -86,76 +113,114 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str, session_id: str
             while True:
                 message = await websocket.receive()
 
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+
                 if "bytes" in message:
-                    audio_data = message["bytes"]
-                    audio_blob = types.Blob(
-                        mime_type="audio/pcm;rate=16000",
-                        data=audio_data
-                    )
-                    live_request_queue.send_realtime(audio_blob)
+                    # Binary frames: byte 0 is the frame type. Audio (0x00) is
+                    # followed by 16 kHz PCM; an image (0x01) by a one-byte mime
+                    # type length, the mime type, then the encoded image
+                    data = message["bytes"]
+                    frame_type = data[0] if data else None
+
+                    if frame_type == FRAME_AUDIO:
+                        live_request_queue.send_realtime(types.Blob(
+                            mime_type="audio/pcm;rate=16000",
+                            data=data[1:]
+                        ))
+
+                    elif frame_type == FRAME_IMAGE:
+                        # A malformed frame is dropped rather than ending the session
+                        if len(data) < 2 or len(data) <= 2 + data[1]:
+                            logger.warning("Dropping truncated image frame of %s bytes", len(data))
+                            continue
+                        mime_end = 2 + data[1]
+                        try:
+                            mime_type = data[2:mime_end].decode("ascii")
+                        except UnicodeDecodeError:
+                            logger.warning("Dropping image frame with a non-ASCII mime type")
+                            continue
+                        # Use send_realtime for video/image stream
+                        # This sends the image as part of the session context
+                        live_request_queue.send_realtime(types.Blob(
+                            mime_type=mime_type,
+                            data=data[mime_end:]
+                        ))
+
+                    else:
+                        logger.warning("Ignoring binary frame of unknown type %s", frame_type)
 
                 elif "text" in message:
                     text_data = message["text"]
-                    logger.debug(f"Received text message: {text_data}")
-                    json_message = json.loads(text_data)
-                    msg_type = json_message.get("type")
-
-                    if msg_type == "text":
-                        content = types.Content(parts=[types.Part(text=json_message["text"])])
-                        live_request_queue.send_content(content)
-                        logger.info(f"📨 Sent text message: {json_message['text']}")
-                    
-                    elif msg_type == "image":
-                        import base64
-                        mime_type = json_message.get("mimeType")
-                        base64_data = json_message.get("data")
-                        
-                        try:
-                            image_bytes = base64.b64decode(base64_data)
-                            image_blob = types.Blob(
-                                mime_type=mime_type,
-                                data=image_bytes
-                            )
-                            # Use send_realtime for video/image stream
-                            # This sends the image as part of the session context
-                            live_request_queue.send_realtime(image_blob)
-                            # logger.info(f"🖼️ Sent image frame: {len(image_bytes)} bytes")
-                        except Exception as e:
-                            logger.error(f"Error processing image: {e}")
-                
+                    logger.debug("Received text message: %s", text_data)
+                    json_message = orjson.loads(text_data)
+                    handler = TEXT_MESSAGE_HANDLERS.get(json_message.get("type"))
+
+                    if handler:
+                        handler(json_message, live_request_queue)
+                    else:
+                        logger.warning("Ignoring text message of unknown type %s", json_message.get('type'))
+
         except WebSocketDisconnect:
             logger.info("WebSocket disconnected")
+            # Stop the live session; raising tears down downstream_task too
+            live_request_queue.close()
+            raise
     
     async def downstream_task():
+        # Small PCM parts are coalesced into frames of at least
+        # AUDIO_FLUSH_BYTES; whatever is left is sent as soon as an event
+        # without audio arrives (turn end, transcription)
+        pending_audio = bytearray()
         try:
             logger.info("Starting downstream task (listening for agent responses)...")
-            async for event in runner.run_live(
+            live_events = runner.run_live(
                 user_id=user_id,
                 session_id=session_id,
                 live_request_queue=live_request_queue,
                 run_config=run_config,
-            ):
-                # Send audio as binary frames for efficient playback
-                # Audio is 24kHz, 16-bit PCM, mono - already decoded by ADK
-                if event.content and event.content.parts:
-                    for part in event.content.parts:
-                        if part.inline_data and part.inline_data.mime_type.startswith("audio/pcm"):
-                            await websocket.send_bytes(part.inline_data.data)
-
-                # Send transcriptions and other events as text JSON
-                if event.input_transcription or event.output_transcription:
-                    event_json = event.model_dump_json(exclude_none=True, by_alias=True)
-                    logger.debug(f"Sending transcription event: {event_json[:200]}")
-                    await websocket.send_text(event_json)
+            )
+            try:
+                async for event in live_events:
+                    if event.interrupted:
+                        # The user barged in; buffered speech is stale
+                        pending_audio.clear()
+
+                    # Send audio as binary frames for efficient playback
+                    # Audio is 24kHz, 16-bit PCM, mono - already decoded by ADK
+                    has_audio = False
+                    if event.content and event.content.parts:
+                        for part in event.content.parts:
+                            if part.inline_data and part.inline_data.mime_type.startswith("audio/pcm"):
+                                has_audio = True
+                                pending_audio += part.inline_data.data
+                    if pending_audio and (len(pending_audio) >= AUDIO_FLUSH_BYTES or not has_audio):
+                        await websocket.send_bytes(bytes(pending_audio))
+                        pending_audio.clear()
+
+                    # Send transcriptions and other events as text JSON
+                    if event.input_transcription or event.output_transcription:
+                        event_json = event.model_dump_json(exclude_none=True, by_alias=True)
+                        logger.debug("Sending transcription event: %s", event_json[:200])
+                        await websocket.send_text(event_json)
+            finally:
+                # Shut the live connection down now rather than when the
+                # generator is garbage collected
+                await live_events.aclose()
         except Exception as e:
-            logger.error(f"Error in downstream_task: {e}", exc_info=True)
+            logger.error("Error in downstream_task: %s", e, exc_info=True)
+            raise
 
+    # If either task fails the other is cancelled, so a disconnect stops the
+    # live session instead of leaving it generating for nobody
     try:
-        await asyncio.gather(upstream_task(), downstream_task(), return_exceptions=True)
-    except WebSocketDisconnect:
+        async with asyncio.TaskGroup() as task_group:
+            task_group.create_task(upstream_task())
+            task_group.create_task(downstream_task())
+    except* WebSocketDisconnect:
         logger.debug("Client disconnected normally")
-    except Exception as e:
-        logger.error(f"Unexpected error in streaming tasks: {e}", exc_info=True)
+    except* Exception as e:
+        logger.error("Unexpected error in streaming tasks: %s", e.exceptions, exc_info=True)
     finally:
         logger.info("Closing live request queue")
         live_request_queue.close()
@@ -4,20 +4,241 @@ Post-Assessment Marker Tools
 Tools for retrieving user answers, questions, saving assessment results,
 and retrieving pre-assessment results for comparative feedback.
 """
-import psycopg2
-import json
-from .config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT
-
-
-def get_db_connection():
-    """Creates PostgreSQL connection"""
-    return psycopg2.connect(
-        host=DB_HOST,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASS,
-        port=DB_PORT
+import functools
+import re
+import threading
+from contextlib import contextmanager
+from psycopg2 import pool, extensions
+from cachetools import TTLCache
+import orjson
+from .config import (
+    DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT, DB_APPLICATION_NAME,
+    DB_POOL_MIN_CONN, DB_POOL_MAX_CONN, DB_PREPARED_STATEMENTS, DB_KEEPALIVE_OPTIONS
+)
+
+
+def _dumps(obj) -> str:
+    """Encode a tool result as a JSON string (orjson, C-accelerated)."""
+    return orjson.dumps(obj).decode()
+
+
+# Encoded results of retrieve_assessment_questions and retrieve_previous_summary,
+# keyed by (tool, assessment_id): the agent often asks for them again within
+# one marking run. save_assessment_results evicts the entries it makes stale
+TOOL_CACHE_TTL_SECONDS = 60
+_tool_cache = TTLCache(maxsize=512, ttl=TOOL_CACHE_TTL_SECONDS)
+_tool_cache_lock = threading.Lock()
+
+
+def _cache_get(key):
+    with _tool_cache_lock:
+        return _tool_cache.get(key)
+
+
+def _cache_put(key, result: str) -> None:
+    with _tool_cache_lock:
+        _tool_cache[key] = result
+
+
+def invalidate(assessment_id: int) -> None:
+    """Evict cached tool results for an assessment."""
+    with _tool_cache_lock:
+        _tool_cache.pop(("previous_summary", assessment_id), None)
+        _tool_cache.pop(("assessment_questions", assessment_id), None)
+
+
+# Every tool statement runs as a server-side prepared statement
+PREVIOUS_SUMMARY_SQL = """
+    SELECT score, summary
+    FROM assessments
+    WHERE id = $1
+"""
+
+# Postgres builds the complete tool result, which is returned as-is. The
+# existence check shares the round trip: no row means the assessment does
+# not exist
+USER_ANSWERS_SQL = """
+    SELECT json_build_object(
+        'assessment_id', a.id,
+        'total_answers', count(ua.question_id),
+        'correct_count', count(ua.question_id) FILTER (WHERE ua.is_correct),
+        'incorrect_count', count(ua.question_id) FILTER (WHERE ua.is_correct IS NOT TRUE),
+        'answers', COALESCE(
+            json_agg(json_build_object(
+                'question_id', ua.question_id,
+                'user_answer', ua.user_answer,
+                'is_correct', ua.is_correct,
+                'answered_at', ua.answered_at
+            ) ORDER BY ua.question_id) FILTER (WHERE ua.question_id IS NOT NULL),
+            '[]'::json
+        )
+    )::text
+    FROM assessments a
+    LEFT JOIN user_answers ua ON ua.assessment_id = a.id
+    WHERE a.id = $1
+    GROUP BY a.id
+"""
+
+POST_QUESTIONS_SQL = """
+    WITH q AS (
+        SELECT id, question_text, correct_answer, COALESCE(difficulty, 'medium') AS difficulty,
+               explanation, order_number
+        FROM questions
+        WHERE material_id = (SELECT material_id FROM assessments WHERE id = $1)
+          AND assessment_type = 'post'
     )
+    SELECT json_build_object(
+        'assessment_id', a.id,
+        'material_id', a.material_id,
+        'total_questions', a.total_questions,
+        'difficulty_distribution', COALESCE(
+            (SELECT json_object_agg(difficulty, n)
+             FROM (SELECT difficulty, count(*) AS n FROM q GROUP BY difficulty) d),
+            '{}'::json
+        ),
+        'questions', COALESCE(
+            (SELECT json_agg(json_build_object(
+                'question_id', id,
+                'question_text', question_text,
+                'correct_answer', correct_answer,
+                'difficulty', difficulty,
+                'explanation', explanation,
+                'order_number', order_number
+            ) ORDER BY order_number) FROM q),
+            '[]'::json
+        )
+    )::text
+    FROM assessments a
+    WHERE a.id = $1
+"""
+
+SAVE_RESULTS_SQL = """
+    UPDATE assessments
+    SET
+        score = $1,
+        summary = $2,
+        status = 'completed',
+        completed_at = CURRENT_TIMESTAMP,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = $3
+    RETURNING id
+"""
+
+# The study session and its pre-assessment in one round trip; the assessment
+# columns are NULL when no pre-assessment is linked or its row is missing
+PRE_ASSESSMENT_SQL = """
+    SELECT s.id, s.pre_assessment_id, s.weak_concepts,
+           a.id, a.score, a.total_questions, a.summary, a.status
+    FROM study_sessions s
+    LEFT JOIN assessments a ON a.id = s.pre_assessment_id
+    WHERE s.post_assessment_id = $1
+"""
+
+
+# Connection pool shared by every tool call, created on first use (or at
+# app startup, see main.py)
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+class PreparingConnection(extensions.connection):
+    """Connection that remembers which named statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+def get_db_pool():
+    """Get or create the PostgreSQL connection pool."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = pool.ThreadedConnectionPool(
+                    DB_POOL_MIN_CONN,
+                    DB_POOL_MAX_CONN,
+                    host=DB_HOST,
+                    database=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASS,
+                    port=DB_PORT,
+                    application_name=DB_APPLICATION_NAME,
+                    connection_factory=PreparingConnection,
+                    **DB_KEEPALIVE_OPTIONS
+                )
+    return _db_pool
+
+
+def close_db_pool():
+    """Close every pooled connection (called on shutdown)."""
+    global _db_pool
+    if _db_pool is not None:
+        _db_pool.closeall()
+        _db_pool = None
+
+
+@contextmanager
+def db_cursor(autocommit=False):
+    """
+    Yield a cursor on a pooled connection; commit on success, roll back on error.
+
+    With autocommit, each statement commits on its own: a tool that runs a
+    single statement skips psycopg2's separate BEGIN and COMMIT round trips.
+    """
+    db_pool = get_db_pool()
+    conn = db_pool.getconn()
+    if conn.closed:
+        # Replace connections dropped by the server while idle in the pool
+        db_pool.putconn(conn, close=True)
+        conn = db_pool.getconn()
+    try:
+        # Connections come back from the pool idle, so this is a local flag
+        conn.autocommit = autocommit
+        with conn.cursor() as cursor:
+            yield cursor
+        if not autocommit:
+            conn.commit()
+    except Exception:
+        if not conn.closed and not autocommit:
+            conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn, close=bool(conn.closed))
+
+
+_PLACEHOLDER_RE = re.compile(r"\$(\d+)")
+
+
+@functools.lru_cache(maxsize=None)
+def _to_pyformat(statement: str) -> tuple:
+    """Rewrite $N placeholders as %(pN)s and return the number of parameters."""
+    numbers = {int(n) for n in _PLACEHOLDER_RE.findall(statement)}
+    return _PLACEHOLDER_RE.sub(r"%(p\1)s", statement), max(numbers, default=0)
+
+
+def execute_prepared(cursor, name: str, statement: str, params: tuple):
+    """
+    Execute a statement as a server-side prepared statement.
+
+    The statement (written with $1, $2, ... placeholders) is PREPAREd the
+    first time a pooled connection runs it, so Postgres parses and plans it
+    once per connection instead of on every tool call.
+    """
+    pyformat_statement, param_count = _to_pyformat(statement)
+    if param_count != len(params):
+        raise ValueError(f"Statement {name} takes {param_count} parameters, got {len(params)}")
+    if not DB_PREPARED_STATEMENTS:
+        # Behind a transaction-pooling PgBouncer: send the statement as-is,
+        # binding by name so a repeated $N reuses the same value
+        cursor.execute(pyformat_statement, {f"p{i}": value for i, value in enumerate(params, 1)})
+        return
+    conn = cursor.connection
+    if name not in conn.prepared_statements:
+        cursor.execute(f"PREPARE {name} AS {statement}")
+        conn.prepared_statements.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cursor.execute(f"EXECUTE {name} ({placeholders})", params)
 
 
 def retrieve_previous_summary(assessment_id: int) -> str:
@@ -41,25 +262,18 @@ def retrieve_previous_summary(assessment_id: int) -> str:
         "previous_summary": "You scored 5/10 (50%)..."
     }
     """
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            SELECT score, summary
-            FROM assessments
-            WHERE id = %s
-            """,
-            (assessment_id,)
-        )
-        row = cursor.fetchone()
+    cache_key = ("previous_summary", assessment_id)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
 
-        cursor.close()
-        conn.close()
+    try:
+        with db_cursor(autocommit=True) as cursor:
+            execute_prepared(cursor, "mk_previous_summary", PREVIOUS_SUMMARY_SQL, (assessment_id,))
+            row = cursor.fetchone()
 
         if not row:
-            return json.dumps({
+            return _dumps({
                 "assessment_id": assessment_id,
                 "error": f"Assessment {assessment_id} not found"
             })
@@ -67,22 +281,25 @@ def retrieve_previous_summary(assessment_id: int) -> str:
         score, summary = row
 
         if summary and summary.strip():
-            return json.dumps({
+            result = _dumps({
                 "assessment_id": assessment_id,
                 "has_previous_summary": True,
                 "previous_score": score,
                 "previous_summary": summary
-            }, indent=2)
+            })
         else:
-            return json.dumps({
+            result = _dumps({
                 "assessment_id": assessment_id,
                 "has_previous_summary": False,
                 "previous_score": score,
                 "previous_summary": None
-            }, indent=2)
+            })
+
+        _cache_put(cache_key, result)
+        return result
 
     except Exception as e:
-        return json.dumps({
+        return _dumps({
             "error": f"Error retrieving previous summary: {str(e)}"
         })
 
@@ -115,68 +332,20 @@ def retrieve_user_answers(assessment_id: int) -> str:
     }
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # First verify assessment exists
-        cursor.execute("SELECT id FROM assessments WHERE id = %s", (assessment_id,))
-        if not cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return json.dumps({
-                "error": f"Assessment {assessment_id} not found"
-            })
+        with db_cursor(autocommit=True) as cursor:
+            # Retrieve all user answers, verifying the assessment exists
+            execute_prepared(cursor, "mk_user_answers", USER_ANSWERS_SQL, (assessment_id,))
+            row = cursor.fetchone()
 
-        # Retrieve all user answers
-        query = """
-        SELECT
-            question_id,
-            user_answer,
-            is_correct,
-            answered_at
-        FROM user_answers
-        WHERE assessment_id = %s
-        ORDER BY question_id;
-        """
-
-        cursor.execute(query, (assessment_id,))
-        rows = cursor.fetchall()
-
-        # Process results
-        answers = []
-        correct_count = 0
-        incorrect_count = 0
-
-        for row in rows:
-            question_id, user_answer, is_correct, answered_at = row
-
-            answers.append({
-                "question_id": question_id,
-                "user_answer": user_answer,
-                "is_correct": is_correct,
-                "answered_at": answered_at.isoformat() if answered_at else None
+        if not row:
+            return _dumps({
+                "error": f"Assessment {assessment_id} not found"
             })
 
-            if is_correct:
-                correct_count += 1
-            else:
-                incorrect_count += 1
-
-        cursor.close()
-        conn.close()
-
-        result = {
-            "assessment_id": assessment_id,
-            "total_answers": len(answers),
-            "correct_count": correct_count,
-            "incorrect_count": incorrect_count,
-            "answers": answers
-        }
-
-        return json.dumps(result, indent=2)
+        return row[0]
 
     except Exception as e:
-        return json.dumps({
+        return _dumps({
             "error": f"Error retrieving user answers: {str(e)}"
         })
 
@@ -212,78 +381,27 @@ def retrieve_assessment_questions(assessment_id: int) -> str:
         ]
     }
     """
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+    cache_key = ("assessment_questions", assessment_id)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
 
-        # Get assessment details
-        cursor.execute(
-            "SELECT material_id, total_questions FROM assessments WHERE id = %s",
-            (assessment_id,)
-        )
-        assessment_row = cursor.fetchone()
+    try:
+        with db_cursor(autocommit=True) as cursor:
+            # Get assessment details with the post-assessment questions for its material
+            execute_prepared(cursor, "mk_post_questions", POST_QUESTIONS_SQL, (assessment_id,))
+            row = cursor.fetchone()
 
-        if not assessment_row:
-            cursor.close()
-            conn.close()
-            return json.dumps({
+        if not row:
+            return _dumps({
                 "error": f"Assessment {assessment_id} not found"
             })
 
-        material_id, total_questions = assessment_row
-
-        # Retrieve post-assessment questions for this material
-        query = """
-        SELECT
-            id,
-            question_text,
-            correct_answer,
-            difficulty,
-            explanation,
-            order_number
-        FROM questions
-        WHERE material_id = %s AND assessment_type = 'post'
-        ORDER BY order_number;
-        """
-
-        cursor.execute(query, (material_id,))
-        rows = cursor.fetchall()
-
-        # Process results
-        questions = []
-        difficulty_distribution = {}
-
-        for row in rows:
-            q_id, q_text, correct_ans, difficulty, explanation, order_num = row
-
-            questions.append({
-                "question_id": q_id,
-                "question_text": q_text,
-                "correct_answer": correct_ans,
-                "difficulty": difficulty or "medium",
-                "explanation": explanation,
-                "order_number": order_num
-            })
-
-            # Count difficulty distribution
-            diff = difficulty or "medium"
-            difficulty_distribution[diff] = difficulty_distribution.get(diff, 0) + 1
-
-        cursor.close()
-        conn.close()
-
-        result = {
-            "assessment_id": assessment_id,
-            "material_id": material_id,
-            "total_questions": total_questions,
-            "difficulty_distribution": difficulty_distribution,
-            "questions": questions
-        }
-
-        return json.dumps(result, indent=2)
+        _cache_put(cache_key, row[0])
+        return row[0]
 
     except Exception as e:
-        return json.dumps({
+        return _dumps({
             "error": f"Error retrieving assessment questions: {str(e)}"
         })
 
@@ -307,52 +425,29 @@ def save_assessment_results(assessment_id: int, score: int, summary: str) -> str
     try:
         # Validation
         if not isinstance(score, int) or score < 0 or score > 10:
-            return json.dumps({
+            return _dumps({
                 "error": f"Validation error: score must be integer 0-10, got {score}"
             })
 
         if not summary or not summary.strip():
-            return json.dumps({
+            return _dumps({
                 "error": "Validation error: summary cannot be empty"
             })
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_cursor(autocommit=True) as cursor:
+            # Update assessment with results; no row comes back if it does not exist
+            execute_prepared(cursor, "mk_save_results", SAVE_RESULTS_SQL, (score, summary.strip(), assessment_id))
+            if cursor.fetchone() is None:
+                return _dumps({
+                    "error": f"Assessment {assessment_id} not found"
+                })
 
-        # Verify assessment exists
-        cursor.execute("SELECT id FROM assessments WHERE id = %s", (assessment_id,))
-        if not cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return json.dumps({
-                "error": f"Assessment {assessment_id} not found"
-            })
-
-        # Update assessment with results
-        update_query = """
-        UPDATE assessments
-        SET
-            score = %s,
-            summary = %s,
-            status = 'completed',
-            completed_at = CURRENT_TIMESTAMP,
-            updated_at = CURRENT_TIMESTAMP
-        WHERE id = %s;
-        """
-
-        cursor.execute(update_query, (score, summary.strip(), assessment_id))
-        conn.commit()
-
-        cursor.close()
-        conn.close()
+        invalidate(assessment_id)
 
         return f"Successfully marked assessment {assessment_id} with score {score}/10. Status: completed"
 
     except Exception as e:
-        if 'conn' in locals():
-            conn.rollback()
-            conn.close()
-        return json.dumps({
+        return _dumps({
             "error": f"Error saving assessment results: {str(e)}"
         })
 
@@ -382,60 +477,33 @@ def retrieve_pre_assessment_results(assessment_id: int) -> str:
     }
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Find the study session that has this post_assessment_id
-        cursor.execute(
-            """
-            SELECT id, pre_assessment_id, weak_concepts
-            FROM study_sessions
-            WHERE post_assessment_id = %s
-            """,
-            (assessment_id,)
-        )
-        session_row = cursor.fetchone()
+        with db_cursor(autocommit=True) as cursor:
+            # Find the study session that has this post_assessment_id, with its pre-assessment
+            execute_prepared(cursor, "mk_pre_assessment", PRE_ASSESSMENT_SQL, (assessment_id,))
+            row = cursor.fetchone()
 
-        if not session_row:
-            cursor.close()
-            conn.close()
-            return json.dumps({
+        if not row:
+            return _dumps({
                 "error": f"No study session found with post_assessment_id = {assessment_id}"
             })
 
-        study_session_id, pre_assessment_id, weak_concepts = session_row
+        study_session_id, pre_assessment_id, weak_concepts, found_pre_assessment_id = row[:4]
 
         if not pre_assessment_id:
-            cursor.close()
-            conn.close()
-            return json.dumps({
+            return _dumps({
                 "error": f"Study session {study_session_id} has no pre-assessment linked",
                 "study_session_id": study_session_id,
                 "weak_concepts": weak_concepts
             })
 
-        # Fetch pre-assessment results
-        cursor.execute(
-            """
-            SELECT score, total_questions, summary, status
-            FROM assessments
-            WHERE id = %s
-            """,
-            (pre_assessment_id,)
-        )
-        pre_row = cursor.fetchone()
-
-        cursor.close()
-        conn.close()
-
-        if not pre_row:
-            return json.dumps({
+        if found_pre_assessment_id is None:
+            return _dumps({
                 "error": f"Pre-assessment {pre_assessment_id} not found in assessments table",
                 "study_session_id": study_session_id,
                 "pre_assessment_id": pre_assessment_id
             })
 
-        pre_score, pre_total, pre_summary, pre_status = pre_row
+        pre_score, pre_total, pre_summary, pre_status = row[4:]
 
         result = {
             "post_assessment_id": assessment_id,
@@ -448,9 +516,9 @@ def retrieve_pre_assessment_results(assessment_id: int) -> str:
             "study_session_id": study_session_id
         }
 
-        return json.dumps(result, indent=2)
+        return _dumps(result)
 
     except Exception as e:
-        return json.dumps({
+        return _dumps({
             "error": f"Error retrieving pre-assessment results: {str(e)}"
         })
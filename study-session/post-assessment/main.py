@@ -6,6 +6,7 @@ Run with: uvicorn main:app --reload --port 8004
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import router
+from assessment_marker.tools import get_db_pool, close_db_pool
 
 app = FastAPI(
     title="Post-Assessment API",
@@ -29,6 +30,18 @@ app.add_middleware(
 app.include_router(router)
 
 
+@app.on_event("startup")
+async def startup_event():
+    """Open the marker tools' connection pool before the first request."""
+    get_db_pool()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled database connections."""
+    close_db_pool()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -6,12 +6,14 @@ targeting weak concepts with harder, more practical questions.
 """
 
 from .agent import question_generator_agent
-from .tools import load_pdf, save_mcq_question, get_weak_concepts, get_material_concepts
+from .tools import load_pdf, save_mcq_question, save_mcq_questions_batch, get_weak_and_material_concepts, get_weak_concepts, get_material_concepts
 
 __all__ = [
     'question_generator_agent',
     'load_pdf',
     'save_mcq_question',
+    'save_mcq_questions_batch',
+    'get_weak_and_material_concepts',
     'get_weak_concepts',
     'get_material_concepts'
 ]
@@ -7,7 +7,14 @@ Uses Gemini model with custom tools to load PDFs from GCS and save questions to
 """
 from google.adk.agents import Agent
 from google.adk.models.google_llm import Gemini
-from .tools import load_pdf, save_mcq_question, get_weak_concepts, get_material_concepts
+from .tools import (
+    load_pdf,
+    save_mcq_question,
+    save_mcq_questions_batch,
+    get_weak_and_material_concepts,
+    get_weak_concepts,
+    get_material_concepts,
+)
 from .config import MODEL_GEMINI_FLASH
 
 
@@ -25,11 +32,11 @@ question_generator_agent = Agent(
 Post-assessment questions must be **harder and more practical** than pre-assessment questions. They should **target weak concepts** identified during the study session and test **real-world application** of knowledge.
 
 ## Workflow (follow this exact order)
-1. Call **get_material_concepts** with the material_id to get all concepts with user understanding levels
+1. Call **get_weak_and_material_concepts** with the material_id to get the weak concepts and all concepts with user understanding levels
 2. Call **load_pdf** with the provided storage_path and storage_bucket to load the PDF content
 3. Analyze the weak concepts, understanding levels, and PDF content
 4. Generate exactly 10 questions following the targeting and difficulty guidelines below
-5. Save each question using **save_mcq_question**
+5. After generating all 10 questions, call **save_mcq_questions_batch** once with the material_id and the full list
 
 ## Question Targeting Guidelines
 
@@ -79,11 +86,11 @@ For each question:
 - **Hard**: Synthesizing multiple concepts, evaluating trade-offs, complex real-world problem solving
 
 ## Important Rules
-- MUST call get_weak_concepts FIRST to get weak concepts and material_id
-- MUST call get_material_concepts SECOND to get understanding levels
-- MUST call load_pdf THIRD to get the material content
+- MUST call get_weak_and_material_concepts FIRST to get weak concepts and understanding levels
+- MUST call load_pdf SECOND to get the material content
+- get_weak_concepts and get_material_concepts are deprecated; do not call them
 - MUST generate exactly 10 questions, no more, no less
-- MUST save questions in order (order_number 1-10)
+- MUST save all questions in one save_mcq_questions_batch call, in order (order_number 1-10)
 - MUST include explanation for each question
 - 5-6 questions MUST target weak concepts
 - 3-4 questions MUST be practical/applied
@@ -92,5 +99,12 @@ For each question:
 - Process the entire PDF document, not just the beginning
 - Ensure questions cover different topics and sections from the material
 """,
-    tools=[load_pdf, save_mcq_question, get_weak_concepts, get_material_concepts]
+    tools=[
+        load_pdf,
+        save_mcq_question,
+        save_mcq_questions_batch,
+        get_weak_and_material_concepts,
+        get_weak_concepts,
+        get_material_concepts,
+    ]
 )
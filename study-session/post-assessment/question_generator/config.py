@@ -11,7 +11,9 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_NAME = os.getenv("DB_NAME", "db")
 DB_USER = os.getenv("DB_USER", "user")
 DB_PASS = os.getenv("DB_PASS", "password")
-DB_PORT = os.getenv("DB_PORT", "5432")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+# Shows up in pg_stat_activity
+DB_APPLICATION_NAME = "post-assessment"
 
 # Google Cloud Configuration
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
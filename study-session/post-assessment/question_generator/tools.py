@@ -1,15 +1,17 @@
 """
 ADK Tools for Post-Assessment Question Generator Agent
 
-Provides four tools:
+Provides six tools:
 1. load_pdf - Loads PDF from Google Cloud Storage
 2. save_mcq_question - Saves generated MCQ questions to PostgreSQL (with assessment_type)
-3. get_weak_concepts - Retrieves weak concepts from study session
-4. get_material_concepts - Retrieves all concepts with user understanding levels
+3. save_mcq_questions_batch - Saves all generated MCQ questions in one statement
+4. get_weak_and_material_concepts - Retrieves weak concepts and material concepts in one call
+5. get_weak_concepts - Retrieves weak concepts from study session (deprecated)
+6. get_material_concepts - Retrieves all concepts with user understanding levels (deprecated)
 """
 import psycopg2
-from psycopg2.extras import Json
-from typing import Dict
+from psycopg2.extras import Json, execute_values
+from typing import Dict, List
 import json
 import logging
 import traceback
@@ -17,7 +19,7 @@ import tempfile
 import os
 from google.cloud import storage
 from PyPDF2 import PdfReader
-from .config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT
+from .config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT, DB_APPLICATION_NAME
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -36,7 +38,8 @@ def get_db_connection():
         database=DB_NAME,
         user=DB_USER,
         password=DB_PASS,
-        port=DB_PORT
+        port=DB_PORT,
+        application_name=DB_APPLICATION_NAME
     )
 
 
@@ -159,35 +162,7 @@ def save_mcq_question(
         ... )
         "Successfully saved question 1 with ID: 123"
     """
-    # Validate inputs
-    errors = []
-
-    # Validate options structure
-    if not isinstance(options, dict):
-        errors.append("options must be a dictionary")
-    else:
-        required_keys = {"A", "B", "C", "D"}
-        if set(options.keys()) != required_keys:
-            errors.append(f"options must have exactly keys A, B, C, D. Got: {list(options.keys())}")
-
-    # Validate correct_answer
-    if correct_answer not in ["A", "B", "C", "D"]:
-        errors.append(f"correct_answer must be A, B, C, or D. Got: {correct_answer}")
-
-    # Validate difficulty
-    if difficulty not in ["easy", "medium", "hard"]:
-        errors.append(f"difficulty must be easy, medium, or hard. Got: {difficulty}")
-
-    # Validate order_number
-    if not (1 <= order_number <= 10):
-        errors.append(f"order_number must be between 1 and 10. Got: {order_number}")
-
-    # Validate required text fields
-    if not question_text or not question_text.strip():
-        errors.append("question_text cannot be empty")
-
-    if not explanation or not explanation.strip():
-        errors.append("explanation cannot be empty")
+    errors = _validate_mcq_question(question_text, options, correct_answer, explanation, difficulty, order_number)
 
     # Return validation errors if any
     if errors:
@@ -243,10 +218,238 @@ def save_mcq_question(
         return f"Error saving question {order_number}: {str(e)}"
 
 
+def save_mcq_questions_batch(material_id: int, questions: List[Dict]) -> str:
+    """
+    Saves all generated MCQ questions in a single database round trip.
+
+    Use this once, after generating all 10 questions, instead of calling
+    save_mcq_question per question. Nothing is saved if any question fails
+    validation or the insert fails.
+
+    Args:
+        material_id: Database ID of the source material
+        questions: List of questions, each a dictionary with the keys
+                   question_text, options, correct_answer, explanation,
+                   difficulty and order_number (as for save_mcq_question)
+
+    Returns:
+        Success message with the saved question IDs or error message
+
+    Example:
+        >>> save_mcq_questions_batch(
+        ...     material_id=1,
+        ...     questions=[{
+        ...         "question_text": "What is Python?",
+        ...         "options": {"A": "A snake", "B": "A programming language", "C": "A framework", "D": "A library"},
+        ...         "correct_answer": "B",
+        ...         "explanation": "Python is a high-level programming language",
+        ...         "difficulty": "easy",
+        ...         "order_number": 1,
+        ...     }, ...],
+        ... )
+        "Successfully saved 10 questions with IDs: 123, 124, ..."
+    """
+    if not questions:
+        return "Validation errors: questions cannot be empty"
+
+    # Validate every question before anything is written
+    errors = []
+    for position, question in enumerate(questions, start=1):
+        question_errors = _validate_mcq_question(
+            question.get("question_text"),
+            question.get("options"),
+            question.get("correct_answer"),
+            question.get("explanation"),
+            question.get("difficulty"),
+            question.get("order_number"),
+        )
+        errors.extend(f"question {position}: {error}" for error in question_errors)
+
+    if errors:
+        return f"Validation errors: {'; '.join(errors)}"
+
+    assessment_type = "post"
+    rows = [
+        (
+            material_id,
+            question["question_text"].strip(),
+            Json(question["options"]),  # Convert dict to JSONB
+            question["correct_answer"],
+            question["explanation"].strip(),
+            question["difficulty"],
+            question["order_number"],
+            assessment_type
+        )
+        for question in questions
+    ]
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn, conn.cursor() as cursor:
+            # One multi-row INSERT for the whole set, committed atomically
+            inserted = execute_values(
+                cursor,
+                """
+                INSERT INTO questions (
+                    material_id, question_text, options, correct_answer,
+                    explanation, difficulty, order_number, assessment_type
+                ) VALUES %s
+                RETURNING id
+                """,
+                rows,
+                fetch=True
+            )
+
+        question_ids = [row[0] for row in inserted]
+        logger.info(f"[TOOL] Saved {len(question_ids)} questions for material {material_id}")
+        return f"Successfully saved {len(question_ids)} questions with IDs: {', '.join(map(str, question_ids))}"
+
+    except psycopg2.IntegrityError as e:
+        return f"Database integrity error: {str(e)}. Questions may already exist for this material."
+
+    except Exception as e:
+        return f"Error saving questions: {str(e)}"
+
+    finally:
+        if conn:
+            conn.close()
+
+
+def _validate_mcq_question(
+    question_text: str,
+    options: Dict[str, str],
+    correct_answer: str,
+    explanation: str,
+    difficulty: str,
+    order_number: int,
+) -> List[str]:
+    """Returns the validation errors for one MCQ question (empty if valid)."""
+    errors = []
+
+    # Validate options structure
+    if not isinstance(options, dict):
+        errors.append("options must be a dictionary")
+    else:
+        required_keys = {"A", "B", "C", "D"}
+        if set(options.keys()) != required_keys:
+            errors.append(f"options must have exactly keys A, B, C, D. Got: {list(options.keys())}")
+
+    # Validate correct_answer
+    if correct_answer not in ["A", "B", "C", "D"]:
+        errors.append(f"correct_answer must be A, B, C, or D. Got: {correct_answer}")
+
+    # Validate difficulty
+    if difficulty not in ["easy", "medium", "hard"]:
+        errors.append(f"difficulty must be easy, medium, or hard. Got: {difficulty}")
+
+    # Validate order_number
+    if not isinstance(order_number, int) or not (1 <= order_number <= 10):
+        errors.append(f"order_number must be between 1 and 10. Got: {order_number}")
+
+    # Validate required text fields
+    if not question_text or not question_text.strip():
+        errors.append("question_text cannot be empty")
+
+    if not explanation or not explanation.strip():
+        errors.append("explanation cannot be empty")
+
+    return errors
+
+
+def get_weak_and_material_concepts(material_id: int) -> str:
+    """
+    Retrieves the weak concepts and all material concepts for a material in one call.
+
+    Weak concepts come from the material's most recent study session; material
+    concepts include the user_understanding field that tracks how well the
+    student understands each concept. Postgres builds the whole JSON result,
+    so both come back in a single database round trip.
+
+    Args:
+        material_id: ID of the material
+
+    Returns:
+        JSON string with the study session's weak concepts and all concepts
+        with their understanding levels
+
+    Example output:
+    {
+        "material_id": 5,
+        "study_session_id": 1,
+        "weak_concepts": [
+            {"concept_id": "c1", "concept_name": "Variables", "reason": "..."},
+            ...
+        ],
+        "total_concepts": 8,
+        "concepts": [
+            {
+                "concept_id": "c1",
+                "concept_name": "Variables",
+                "description": "...",
+                "user_understanding": "weak",
+                "page_start": 1,
+                "page_end": 5,
+                "prerequisite_concepts": [...]
+            },
+            ...
+        ]
+    }
+    """
+    logger.info(f"[TOOL] get_weak_and_material_concepts called: material_id={material_id}")
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        query = """
+        WITH c AS (
+            SELECT concept_id, concept_name, description, user_understanding,
+                   page_start, page_end, prerequisite_concepts
+            FROM material_concepts
+            WHERE material_id = %(material_id)s
+        )
+        SELECT json_build_object(
+            'material_id', %(material_id)s,
+            'study_session_id', s.id,
+            'weak_concepts', COALESCE(s.weak_concepts, '[]'::jsonb),
+            'total_concepts', (SELECT count(*) FROM c),
+            'concepts', COALESCE((SELECT json_agg(c ORDER BY c.page_start) FROM c), '[]'::json)
+        )::text
+        FROM (SELECT 1) AS one
+        LEFT JOIN LATERAL (
+            SELECT id, weak_concepts
+            FROM study_sessions
+            WHERE material_id = %(material_id)s
+            ORDER BY created_at DESC
+            LIMIT 1
+        ) s ON TRUE;
+        """
+
+        cursor.execute(query, {"material_id": material_id})
+        result = cursor.fetchone()[0]
+
+        cursor.close()
+        conn.close()
+
+        logger.info(f"[TOOL] Loaded weak and material concepts for material {material_id}")
+
+        return result
+
+    except Exception as e:
+        logger.error(f"[TOOL] get_weak_and_material_concepts error: {str(e)}")
+        return json.dumps({
+            "error": f"Error retrieving weak and material concepts: {str(e)}"
+        })
+
+
 def get_weak_concepts(study_session_id: int) -> str:
     """
     Retrieves weak concepts and material_id from a study session.
 
+    Deprecated: use get_weak_and_material_concepts, which also returns the
+    material concepts in the same call.
+
     Queries the study_sessions table for the weak_concepts JSONB field,
     which contains concepts the student struggled with during the study session.
 
@@ -312,6 +515,9 @@ def get_material_concepts(material_id: int) -> str:
     """
     Retrieves all concepts for a material with user understanding levels.
 
+    Deprecated: use get_weak_and_material_concepts, which also returns the
+    weak concepts in the same call.
+
     Queries the material_concepts table for all concepts mapped to the material,
     including the user_understanding field that tracks how well the student
     understands each concept.
@@ -14,6 +14,7 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from typing import Optional
 import psycopg2
+import asyncio
 import logging
 import json
 import traceback
@@ -39,8 +40,9 @@ logger = logging.getLogger(__name__)
 
 from question_generator.agent import question_generator_agent
 from assessment_marker.agent import assessment_marker_agent
-from config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT, MaterialStatus, AssessmentStatus
+from config import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT, DB_APPLICATION_NAME, MaterialStatus, AssessmentStatus
 from google.adk import Runner
+from google.adk.agents.run_config import RunConfig, ToolThreadPoolConfig
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
 
@@ -48,6 +50,10 @@ from google.genai import types
 
 router = APIRouter(prefix="/api/post-assessment", tags=["post-assessment"])
 
+# The agents' tools are blocking psycopg2 calls; ADK runs them on a thread
+# pool so one request's database round trips don't stall the event loop
+agent_run_config = RunConfig(tool_thread_pool_config=ToolThreadPoolConfig(max_workers=8))
+
 
 class GenerateQuestionsRequest(BaseModel):
     """Request model for question generation"""
@@ -152,7 +158,8 @@ def get_db_connection():
             database=DB_NAME,
             user=DB_USER,
             password=DB_PASS,
-            port=DB_PORT
+            port=DB_PORT,
+            application_name=DB_APPLICATION_NAME
         )
         logger.debug("Database connection successful")
         return conn
@@ -224,6 +231,31 @@ def verify_questions_count(material_id: int, assessment_type: str) -> int:
         return 0
 
 
+def get_latest_post_assessment(material_id: int, user_id: int) -> Optional[tuple]:
+    """
+    Get the user's most recent post-assessment for a material.
+
+    Returns:
+        (id, status, score, total_questions, summary), or None
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, status, score, total_questions, summary
+            FROM assessments WHERE material_id = %s AND user_id = %s AND assessment_type = 'post'
+            ORDER BY created_at DESC LIMIT 1
+            """,
+            (material_id, user_id)
+        )
+        existing_assessment = cursor.fetchone()
+        cursor.close()
+        return existing_assessment
+    finally:
+        conn.close()
+
+
 @router.post("/generate-questions", response_model=GenerateQuestionsResponse)
 async def generate_questions(request: GenerateQuestionsRequest):
     """
@@ -250,19 +282,7 @@ async def generate_questions(request: GenerateQuestionsRequest):
 
     try:
         # Check if a post-assessment already exists for this material
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT id, status, score, total_questions, summary
-            FROM assessments WHERE material_id = %s AND user_id = %s AND assessment_type = 'post'
-            ORDER BY created_at DESC LIMIT 1
-            """,
-            (request.material_id, request.user_id)
-        )
-        existing_assessment = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        existing_assessment = await asyncio.to_thread(get_latest_post_assessment, request.material_id, request.user_id)
 
         if existing_assessment:
             assessment_id, assessment_status, score, total_questions, summary = existing_assessment
@@ -286,7 +306,7 @@ async def generate_questions(request: GenerateQuestionsRequest):
                 )
 
         # Check if post-assessment questions already exist for this material filtered by assessment_type
-        existing_count = verify_questions_count(request.material_id, "post")
+        existing_count = await asyncio.to_thread(verify_questions_count, request.material_id, "post")
         if existing_count > 0:
             logger.info(f"Found {existing_count} existing post-assessment questions for material {request.material_id}, skipping generation")
             return GenerateQuestionsResponse(
@@ -300,7 +320,7 @@ async def generate_questions(request: GenerateQuestionsRequest):
 
         # Step 1: Update material status to 'processing'
         logger.info(f"[1/4] Updating material {request.material_id} status to 'processing'")
-        update_material_status(request.material_id, MaterialStatus.PROCESSING)
+        await asyncio.to_thread(update_material_status, request.material_id, MaterialStatus.PROCESSING)
         logger.info(f"[1/4] Status updated successfully")
 
         # Step 2: Run agent
@@ -332,7 +352,8 @@ async def generate_questions(request: GenerateQuestionsRequest):
             async for event in runner.run_async(
                 user_id=str(request.user_id), 
                 session_id=str(request.session_id), 
-                new_message=user_content
+                new_message=user_content,
+                run_config=agent_run_config
             ):
                 pass
 
@@ -345,13 +366,13 @@ async def generate_questions(request: GenerateQuestionsRequest):
 
         # Step 3: Verify questions were saved
         logger.info(f"[3/4] Verifying questions were saved to database")
-        questions_count = verify_questions_count(request.material_id, "post")
+        questions_count = await asyncio.to_thread(verify_questions_count, request.material_id, "post")
         logger.info(f"[3/4] Found {questions_count} post-assessment questions in database")
 
         # Step 4: Update status based on result
         if questions_count == 10:
             logger.info(f"[4/4] All 10 questions saved, updating status to 'completed'")
-            update_material_status(request.material_id, MaterialStatus.COMPLETED)
+            await asyncio.to_thread(update_material_status, request.material_id, MaterialStatus.COMPLETED)
             logger.info(f"[4/4] Status updated to 'completed'")
             logger.info(f"=== GENERATE POST-ASSESSMENT QUESTIONS SUCCESS ===")
 
@@ -365,7 +386,7 @@ async def generate_questions(request: GenerateQuestionsRequest):
         else:
             logger.warning(f"[4/4] Expected 10 questions but only {questions_count} were saved")
             logger.info(f"[4/4] Updating status to 'failed'")
-            update_material_status(request.material_id, MaterialStatus.FAILED)
+            await asyncio.to_thread(update_material_status, request.material_id, MaterialStatus.FAILED)
             logger.error(f"=== GENERATE POST-ASSESSMENT QUESTIONS FAILED (incomplete) ===")
 
             raise HTTPException(
@@ -384,7 +405,7 @@ async def generate_questions(request: GenerateQuestionsRequest):
         # Update material status to 'failed'
         try:
             logger.info(f"Attempting to update material status to 'failed'")
-            update_material_status(request.material_id, MaterialStatus.FAILED)
+            await asyncio.to_thread(update_material_status, request.material_id, MaterialStatus.FAILED)
             logger.info(f"Status updated to 'failed'")
         except Exception as status_error:
             logger.error(f"Failed to update status: {str(status_error)}")
@@ -396,7 +417,7 @@ async def generate_questions(request: GenerateQuestionsRequest):
 
 
 @router.post("/start-assessment", response_model=StartAssessmentResponse)
-async def start_assessment(request: StartAssessmentRequest):
+def start_assessment(request: StartAssessmentRequest):
     """Start a new post-assessment attempt and link it to the study session"""
     try:
         conn = get_db_connection()
@@ -446,7 +467,7 @@ async def start_assessment(request: StartAssessmentRequest):
 
 
 @router.get("/questions/{material_id}")
-async def get_questions(material_id: int):
+def get_questions(material_id: int):
     """Fetch all post-assessment questions for a material"""
     try:
         conn = get_db_connection()
@@ -482,7 +503,7 @@ async def get_questions(material_id: int):
 
 
 @router.post("/save-answer", response_model=SaveAnswerResponse)
-async def save_answer(request: SaveAnswerRequest):
+def save_answer(request: SaveAnswerRequest):
     """Save a user answer and check correctness"""
     try:
         conn = get_db_connection()
@@ -554,7 +575,7 @@ def update_assessment_status(assessment_id: int, status: str) -> None:
 
 
 @router.post("/update-assessment-status")
-async def update_assessment_status_endpoint(request: UpdateAssessmentStatusRequest):
+def update_assessment_status_endpoint(request: UpdateAssessmentStatusRequest):
     """Endpoint to update assessment status"""
     try:
         update_assessment_status(request.assessment_id, request.status)
@@ -633,7 +654,7 @@ async def mark_assessment(request: MarkAssessmentRequest):
     """
     try:
         # Update assessment status to 'processing'
-        update_assessment_status(request.assessment_id, 'processing')
+        await asyncio.to_thread(update_assessment_status, request.assessment_id, 'processing')
 
 
         # Use Runner to execute the marking agent with in-memory session service
@@ -662,12 +683,13 @@ async def mark_assessment(request: MarkAssessmentRequest):
         async for event in runner.run_async(
             user_id=str(request.user_id), 
             session_id=str(request.session_id), 
-            new_message=user_content
+            new_message=user_content,
+            run_config=agent_run_config
         ):
             pass
 
         # Retrieve saved results from database
-        results = get_assessment_results(request.assessment_id)
+        results = await asyncio.to_thread(get_assessment_results, request.assessment_id)
 
         if not results:
             raise HTTPException(
@@ -700,7 +722,7 @@ async def mark_assessment(request: MarkAssessmentRequest):
     except Exception as e:
         # Update assessment status back to 'in_progress' on failure
         try:
-            update_assessment_status(request.assessment_id, 'in_progress')
+            await asyncio.to_thread(update_assessment_status, request.assessment_id, 'in_progress')
         except:
             pass
 
@@ -126,13 +126,13 @@ def retrieve_user_answers(assessment_id: int) -> str:
                 "error": f"Assessment {assessment_id} not found"
             })
 
-        # Retrieve all user answers
+        # Retrieve all user answers (answered_at already as ISO 8601 text)
         query = """
         SELECT
             question_id,
             user_answer,
             is_correct,
-            answered_at
+            to_char(answered_at, 'YYYY-MM-DD"T"HH24:MI:SS.US')
         FROM user_answers
         WHERE assessment_id = %s
         ORDER BY question_id;
@@ -153,7 +153,7 @@ def retrieve_user_answers(assessment_id: int) -> str:
                 "question_id": question_id,
                 "user_answer": user_answer,
                 "is_correct": is_correct,
-                "answered_at": answered_at.isoformat() if answered_at else None
+                "answered_at": answered_at
             })
 
             if is_correct: